@@ -2,6 +2,7 @@ import os
 from core.st_utils.imports_and_utils import *
 from core.utils.onekeycleanup import cleanup
 from core.utils import load_key
+from core.utils.ask_gpt import reset_llm_stats
 import shutil
 from functools import partial
 from rich.panel import Panel
@@ -19,6 +20,8 @@ YTB_RESOLUTION_KEY = "ytb_resolution"
 def process_video(file, dubbing=False, is_retry=False):
     if not is_retry:
         prepare_output_folder(OUTPUT_DIR)
+    # the stage tables report this video only, not every video of the batch so far
+    reset_llm_stats()
     
     text_steps = [
         ("🎥 Processing input file", partial(process_input_file, file)),
@@ -28,6 +31,9 @@ def process_video(file, dubbing=False, is_retry=False):
         ("⚡ Processing and aligning subtitles", process_and_align_subtitles),
         ("🎬 Merging subtitles to video", _7_sub_into_vid.merge_subtitles_to_video),
     ]
+    if load_key("streaming_pipeline"):
+        # transcription, splitting and translation overlap in one step
+        text_steps[1:4] = [("🎙️ Transcribing, splitting and translating (streaming)", stream_pipeline.transcribe_and_translate)]
     
     if dubbing:
         dubbing_steps = [
@@ -99,7 +99,7 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
             remaining_tasks = tasks_df.iloc[warmup_size:].copy()
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
                 futures = [
-                    executor.submit(process_row, row, tasks_df.copy())
+                    executor.submit(bind_job_config(process_row), row, tasks_df.copy())
                     for _, row in remaining_tasks.iterrows()
                 ]
                 
@@ -1,15 +1,40 @@
 from core.utils import *
 from core.asr_backend.demucs_vl import demucs_audio
 from core.asr_backend.audio_preprocess import process_transcription, convert_video_to_audio, split_audio, save_results, normalize_audio_volume
+from core.asr_backend import asr_cache
 from core._1_ytdlp import find_video_files
 from core.utils.models import *
 
 @check_file_exists(_2_CLEANED_CHUNKS)
-def transcribe():
+def transcribe(on_segment=None):
+    """on_segment(index, result) gets each segment's result in order as soon as it is transcribed, see stream_pipeline"""
     # 1. video to audio
     video_file = find_video_files()
     convert_video_to_audio(video_file)
 
+    # 1.2 The same audio transcribed with the same settings by any earlier job: no Demucs, no ASR
+    cache_key = asr_cache.cache_key(_RAW_AUDIO_FILE)
+    cached = asr_cache.load_cached(cache_key)
+    if cached is not None:
+        rprint(f"[green]♻️ Reusing the cached transcription of this audio ({cached['language']}, {len(cached['segments'])} segments)[/green]")
+        if 'auto' in load_key("whisper.language"):
+            set_job_key("whisper.language", cached['language'])
+        set_job_key("whisper.detected_language", cached['language'])
+        combined_result = {'segments': cached['segments']}
+        if on_segment is not None:
+            on_segment(0, combined_result)
+        save_results(process_transcription(combined_result))
+        return
+
+    # 1.5 Local model: detect the language on a few windows first, so a zh video gets the zh model from the start
+    runtime = load_key("whisper.runtime")
+    workers = 0
+    if runtime == "local":
+        from core.asr_backend.whisperX_local import shard_workers, probe_language
+        workers = shard_workers()
+        # the probe's model is kept for transcription unless Demucs needs the memory first or sharded workers load their own
+        probe_language(_RAW_AUDIO_FILE, keep_model=workers <= 1 and not load_key("demucs"))
+
     # 2. Demucs vocal separation:
     if load_key("demucs"):
         demucs_audio()
@@ -18,11 +43,20 @@ def transcribe():
         vocal_audio = _RAW_AUDIO_FILE
 
     # 3. Extract audio
-    segments = split_audio(_RAW_AUDIO_FILE)
+    segment_len = None
+    if workers > 1:
+        # shorter shards, one per worker process at a time
+        segment_len = load_key("whisper.cpu_shards.shard_len")
+    if on_segment is not None:
+        # streaming: short segments, so splitting and translation start after the first one instead of the first 30 minutes
+        segment_len = min(segment_len or float('inf'), load_key("streaming_segment_len"))
+    if segment_len:
+        segments = split_audio(_RAW_AUDIO_FILE, target_len=segment_len, win=min(60, segment_len / 5))
+    else:
+        segments = split_audio(_RAW_AUDIO_FILE)
     
     # 4. Transcribe audio by clips
     all_results = []
-    runtime = load_key("whisper.runtime")
     if runtime == "local":
         from core.asr_backend.whisperX_local import transcribe_audio as ts
         rprint("[cyan]🎤 Transcribing audio with local model...[/cyan]")
@@ -33,15 +67,33 @@ def transcribe():
         from core.asr_backend.elevenlabs_asr import transcribe_audio_elevenlabs as ts
         rprint("[cyan]🎤 Transcribing audio with ElevenLabs API...[/cyan]")
 
-    for start, end in segments:
-        result = ts(_RAW_AUDIO_FILE, vocal_audio, start, end)
-        all_results.append(result)
+    try:
+        if workers > 1 and len(segments) > 1:
+            from core.asr_backend.whisperX_local import transcribe_shards
+            all_results = transcribe_shards(_RAW_AUDIO_FILE, vocal_audio, segments, min(workers, len(segments)), on_result=on_segment)
+        elif runtime == "local":
+            # decode, transcription and alignment of neighbouring segments overlap
+            from core.asr_backend.whisperX_local import transcribe_segments
+            all_results = transcribe_segments(_RAW_AUDIO_FILE, vocal_audio, segments, on_result=on_segment)
+        else:
+            for i, (start, end) in enumerate(segments):
+                result = ts(_RAW_AUDIO_FILE, vocal_audio, start, end)
+                all_results.append(result)
+                if on_segment is not None:
+                    on_segment(i, result)
+    finally:
+        if runtime == "local":
+            # the local models stay loaded across segments, free them once
+            from core.asr_backend.whisperX_local import close_session
+            close_session()
     
     # 5. Combine results
     combined_result = {'segments': []}
     for result in all_results:
         combined_result['segments'].extend(result['segments'])
     
+    asr_cache.save_cached(cache_key, combined_result, load_key("whisper.detected_language"))
+
     # 6. Process df
     df = process_transcription(combined_result)
     save_results(df)
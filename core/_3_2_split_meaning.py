@@ -1,12 +1,14 @@
-import concurrent.futures
 from difflib import SequenceMatcher
 import math
-from core.prompts import get_split_prompt
+from core.prompts import get_split_prompt, get_split_batch_prompt
 from core.spacy_utils.load_nlp_model import init_nlp
 from core.utils import *
 from rich.console import Console
 from rich.table import Table
 from core.utils.models import _3_1_SPLIT_BY_NLP, _3_2_SPLIT_BY_MEANING
+from core.utils.ask_gpt import report_llm_stats, stream_expect_keys
+from core.utils.llm_engine import run_sync, run_all
+from core.utils.llm_batch import PromptBatcher
 console = Console()
 
 def tokenize_sentence(sentence, nlp):
@@ -45,18 +47,30 @@ def find_split_positions(original, modified):
 
     return split_positions
 
-def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
-    """Split a long sentence using GPT and return the result as a string."""
+def valid_split(response_data):
+    choice = response_data["choice"]
+    if f'split{choice}' not in response_data:
+        return {"status": "error", "message": "Missing required key: `split`"}
+    if "[br]" not in response_data[f"split{choice}"]:
+        return {"status": "error", "message": "Split failed, no [br] found"}
+    return {"status": "success", "message": "Split completed"}
+
+async def _ask_split(payload):
+    sentence, num_parts, word_limit, retry_attempt = payload
     split_prompt = get_split_prompt(sentence, num_parts, word_limit)
-    def valid_split(response_data):
-        choice = response_data["choice"]
-        if f'split{choice}' not in response_data:
-            return {"status": "error", "message": "Missing required key: `split`"}
-        if "[br]" not in response_data[f"split{choice}"]:
-            return {"status": "error", "message": "Split failed, no [br] found"}
-        return {"status": "success", "message": "Split completed"}
-    
-    response_data = ask_gpt(split_prompt + " " * retry_attempt, resp_type='json', valid_def=valid_split, log_title='split_by_meaning')
+    return await ask_gpt_async(split_prompt + " " * retry_attempt, resp_type='json', valid_def=valid_split, log_title='split_by_meaning',
+                               stream_check=stream_expect_keys(['split1', 'split2', 'choice'], allowed_keys=['analysis', 'assess']))
+
+def _split_batch_prompt(items):
+    retry_attempt = max(retry for _, _, _, retry in items.values())
+    return get_split_batch_prompt({key: (sentence, num_parts, word_limit) for key, (sentence, num_parts, word_limit, _) in items.items()}) + " " * retry_attempt
+
+# pending splits of the running stage are packed into one request, invalid items are asked again alone
+split_batcher = PromptBatcher("split", "split_by_meaning", _split_batch_prompt, lambda payload, data: valid_split(data), _ask_split)
+
+async def split_sentence_async(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
+    """Split a long sentence using GPT and return the result as a string."""
+    response_data = await split_batcher.submit((sentence, num_parts, word_limit, retry_attempt))
     choice = response_data["choice"]
     best_split = response_data[f"split{choice}"]
     split_points = find_split_positions(sentence, best_split)
@@ -80,30 +94,30 @@ def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0
     
     return best_split
 
-def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0):
-    """Split sentences in parallel using a thread pool."""
+def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
+    return run_sync(split_sentence_async(sentence, num_parts, word_limit, index=index, retry_attempt=retry_attempt))
+
+def parallel_split_sentences(sentences, max_length, nlp, retry_attempt=0):
+    """Split sentences concurrently on the LLM engine."""
     new_sentences = [None] * len(sentences)
-    futures = []
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for index, sentence in enumerate(sentences):
-            # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            # print("Tokenization result:", tokens)
-            num_parts = math.ceil(len(tokens) / max_length)
-            if len(tokens) > max_length:
-                future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
-            else:
-                new_sentences[index] = [sentence]
-
-        for future, index, num_parts, sentence in futures:
-            split_result = future.result()
-            if split_result:
-                split_lines = split_result.strip().split('\n')
-                new_sentences[index] = [line.strip() for line in split_lines]
-            else:
-                new_sentences[index] = [sentence]
+    jobs = []
+
+    for index, sentence in enumerate(sentences):
+        # Use tokenizer to split the sentence
+        tokens = tokenize_sentence(sentence, nlp)
+        num_parts = math.ceil(len(tokens) / max_length)
+        if len(tokens) > max_length:
+            jobs.append((index, sentence, split_sentence_async(sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)))
+        else:
+            new_sentences[index] = [sentence]
+
+    split_results = run_all([coro for _, _, coro in jobs])
+    for (index, sentence, _), split_result in zip(jobs, split_results):
+        if split_result:
+            split_lines = split_result.strip().split('\n')
+            new_sentences[index] = [line.strip() for line in split_lines]
+        else:
+            new_sentences[index] = [sentence]
 
     return [sentence for sublist in new_sentences for sentence in sublist]
 
@@ -117,12 +131,13 @@ def split_sentences_by_meaning():
     nlp = init_nlp()
     # 🔄 process sentences multiple times to ensure all are split
     for retry_attempt in range(3):
-        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt)
+        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), nlp=nlp, retry_attempt=retry_attempt)
 
     # 💾 save results
     with open(_3_2_SPLIT_BY_MEANING, 'w', encoding='utf-8') as f:
         f.write('\n'.join(sentences))
     console.print('[green]✅ All sentences have been successfully split![/green]')
+    report_llm_stats(['split_by_meaning'])
 
 if __name__ == '__main__':
     # print(split_sentence('Which makes no sense to the... average guy who always pushes the character creation slider all the way to the right.', 2, 22))
@@ -3,6 +3,7 @@ from core.prompts import get_summary_prompt
 import pandas as pd
 from core.utils import *
 from core.utils.models import _3_2_SPLIT_BY_MEANING, _4_1_TERMINOLOGY
+from core.utils.ask_gpt import report_llm_stats
 
 CUSTOM_TERMS_PATH = 'custom_terms.xlsx'
 
@@ -30,8 +31,10 @@ def search_things_to_note_in_prompt(sentence):
     else:
         return None
 
-def get_summary():
-    src_content = combine_chunks()
+def get_summary(src_content=None):
+    """src_content: the text to summarize, by default the start of the split sentences file"""
+    if src_content is None:
+        src_content = combine_chunks()
     custom_terms = pd.read_excel(CUSTOM_TERMS_PATH)
     custom_terms_json = {
         "terms": 
@@ -66,6 +69,7 @@ def get_summary():
         json.dump(summary, f, ensure_ascii=False, indent=4)
 
     rprint(f'💾 Summary log saved to → `{_4_1_TERMINOLOGY}`')
+    report_llm_stats(['summary'])
 
 if __name__ == '__main__':
     get_summary()
\ No newline at end of file
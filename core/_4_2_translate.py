@@ -1,7 +1,6 @@
 import pandas as pd
 import json
-import concurrent.futures
-from core.translate_lines import translate_lines
+from core.translate_lines import translate_lines_async
 from core._4_1_summarize import search_things_to_note_in_prompt
 from core._8_1_audio_task import check_len_then_trim
 from core._6_gen_sub import align_timestamp
@@ -10,27 +9,66 @@ from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from difflib import SequenceMatcher
 from core.utils.models import *
+from core.utils.ask_gpt import report_llm_stats
+from core.utils.llm_engine import run_all, estimate_tokens
+from core.prompts import get_glossary_prompt, generate_shared_prompt, get_prompt_faithfulness, get_prompt_expressiveness
+from core.prompts import get_prefix_faithfulness, get_prefix_expressiveness, get_chunk_prompt
 console = Console()
 
+def _prompt_overhead(theme_prompt, glossary_prompt):
+    """Tokens of the translation prompts without any subtitle line, the larger of the two steps"""
+    if load_key('prompt_layout') == 'prefix_cache':
+        prompts = [get_chunk_prompt(get_prefix_faithfulness(theme_prompt, glossary_prompt), "", None, None, None, ""),
+                   get_chunk_prompt(get_prefix_expressiveness(theme_prompt, glossary_prompt), "", None, None, None, "")]
+    else:
+        shared_prompt = generate_shared_prompt(None, None, theme_prompt, None)
+        prompts = [get_prompt_faithfulness("", shared_prompt), get_prompt_expressiveness({}, "", shared_prompt)]
+    return max(estimate_tokens(prompt) for prompt in prompts)
+
+def _line_tokens(tokens, reflect, compact=False):
+    """Prompt + expected answer tokens for one subtitle line of `tokens` tokens:
+    the line and its json template in the prompt, origin and translation (+ reflection and free translation) in the answer.
+    compact answers only hold the translation, the direct translation is repeated in the expressiveness prompt instead"""
+    if compact:
+        return (2 * tokens + 20) + (tokens + 10) if reflect else (tokens + 10) + (tokens + 10)
+    if reflect:
+        return (3 * tokens + 30) + (4 * tokens + 45)
+    return (2 * tokens + 15) + (2 * tokens + 15)
+
+def pack_chunks(sentences, theme_prompt, terms, token_budget, max_lines, line_average):
+    """Pack lines into chunks until prompt (instructions, theme, context, glossary notes, lines) plus expected answer reach token_budget,
+    yield each multi-line text chunk as soon as it is full. `sentences` may be a generator that is still being filled (stream_pipeline),
+    `line_average` is the average tokens per line, used for the context lines"""
+    reflect = load_key('reflect_translate')
+    compact = load_key('translate_format') == 'compact'
+    # previous 3 + next 2 lines of context
+    overhead = _prompt_overhead(theme_prompt, get_glossary_prompt(terms)) + int(5 * line_average)
+    term_tokens = [(term['src'].lower(), estimate_tokens(get_glossary_prompt([term]))) for term in terms]
+
+    chunk, used, noted = [], overhead, set()
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence)
+        lowered = sentence.lower()
+        new_terms = [(src, cost) for src, cost in term_tokens if src in lowered and src not in noted]
+        cost = _line_tokens(tokens, reflect, compact) + sum(c for _, c in new_terms)
+        if chunk and (used + cost > token_budget or len(chunk) == max_lines):
+            yield '\n'.join(chunk)
+            chunk, used, noted = [], overhead, set()
+            new_terms = [(src, c) for src, c in term_tokens if src in lowered]
+            cost = _line_tokens(tokens, reflect, compact) + sum(c for _, c in new_terms)
+        chunk.append(sentence)
+        used += cost
+        noted.update(src for src, _ in new_terms)
+    if chunk:
+        yield '\n'.join(chunk)
+
 # Function to split text into chunks
-def split_chunks_by_chars(chunk_size, max_i): 
-    """Split text into chunks based on character count, return a list of multi-line text chunks"""
+def split_chunks_by_tokens(theme_prompt, terms, token_budget, max_lines):
+    """All lines of the split sentences file packed into a list of multi-line text chunks"""
     with open(_3_2_SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
         sentences = file.read().strip().split('\n')
-
-    chunks = []
-    chunk = ''
-    sentence_count = 0
-    for sentence in sentences:
-        if len(chunk) + len(sentence + '\n') > chunk_size or sentence_count == max_i:
-            chunks.append(chunk.strip())
-            chunk = sentence + '\n'
-            sentence_count = 1
-        else:
-            chunk += sentence + '\n'
-            sentence_count += 1
-    chunks.append(chunk.strip())
-    return chunks
+    line_average = sum(estimate_tokens(sentence) for sentence in sentences) / max(1, len(sentences))
+    return list(pack_chunks(sentences, theme_prompt, terms, token_budget, max_lines, line_average))
 
 # Get context from surrounding chunks
 def get_previous_content(chunks, chunk_index):
@@ -39,11 +77,12 @@ def get_after_content(chunks, chunk_index):
     return None if chunk_index == len(chunks) - 1 else chunks[chunk_index + 1].split('\n')[:2] # Get first 2 lines
 
 # 🔍 Translate a single chunk
-def translate_chunk(chunk, chunks, theme_prompt, i):
+async def translate_chunk(chunk, chunks, theme_prompt, i, glossary_prompt=None):
     things_to_note_prompt = search_things_to_note_in_prompt(chunk)
     previous_content_prompt = get_previous_content(chunks, i)
     after_content_prompt = get_after_content(chunks, i)
-    translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i)
+    translation, english_result = await translate_lines_async(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i,
+                                                              glossary_prompt=glossary_prompt)
     return i, english_result, translation
 
 # Add similarity calculation function
@@ -54,25 +93,24 @@ def similar(a, b):
 @check_file_exists(_4_2_TRANSLATION)
 def translate_all():
     console.print("[bold green]Start Translating All...[/bold green]")
-    chunks = split_chunks_by_chars(chunk_size=600, max_i=10)
     with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
-        theme_prompt = json.load(file).get('theme')
+        terminology = json.load(file)
+    theme_prompt = terminology.get('theme')
+    glossary_prompt = get_glossary_prompt(terminology.get('terms', []))
+    chunk_set = load_key('translate_chunk')
+    chunks = split_chunks_by_tokens(theme_prompt, terminology.get('terms', []), chunk_set['token_budget'], chunk_set['max_lines'])
+    num_lines = sum(chunk.count('\n') + 1 for chunk in chunks)
+    console.print(f"[cyan]📦 {num_lines} lines packed into {len(chunks)} chunks of up to {chunk_set['token_budget']} tokens[/cyan]")
 
-    # 🔄 Use concurrent execution for translation
+    # 🔄 Translate all chunks concurrently on the LLM engine
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as progress:
         task = progress.add_task("[cyan]Translating chunks...", total=len(chunks))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-            futures = []
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(translate_chunk, chunk, chunks, theme_prompt, i)
-                futures.append(future)
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress.update(task, advance=1)
+        results = run_all([translate_chunk(chunk, chunks, theme_prompt, i, glossary_prompt) for i, chunk in enumerate(chunks)],
+                          on_done=lambda i, result: progress.update(task, advance=1))
+    save_translation(chunks, results)
 
-    results.sort(key=lambda x: x[0])  # Sort results based on original order
-    
+def save_translation(chunks, results):
+    """Match the translated chunks back to their source lines, align them to the transcript, trim and save"""
     # 💾 Save results to lists and Excel file
     src_text, trans_text = [], []
     for i, chunk in enumerate(chunks):
@@ -102,11 +140,13 @@ def translate_all():
     df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
     console.print(df_time)
     # apply check_len_then_trim to df_time['Translation'], only when duration > MIN_TRIM_DURATION.
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    min_trim_duration = load_typed("min_trim_duration", float)
+    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > min_trim_duration else x['Translation'], axis=1)
     console.print(df_time)
     
     df_time.to_excel(_4_2_TRANSLATION, index=False)
     console.print("[bold green]✅ Translation completed and results saved.[/bold green]")
+    report_llm_stats(['translate_faithfulness', 'translate_expressiveness', 'sub_trim'])
 
 if __name__ == '__main__':
     translate_all()
\ No newline at end of file
@@ -1,14 +1,16 @@
 import pandas as pd
 from typing import List, Tuple
-import concurrent.futures
 
-from core._3_2_split_meaning import split_sentence
-from core.prompts import get_align_prompt
+from core._3_2_split_meaning import split_sentence_async
+from core.prompts import get_align_prompt, get_align_batch_prompt
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
 from core.utils import *
 from core.utils.models import *
+from core.utils.ask_gpt import report_llm_stats, stream_expect_keys
+from core.utils.llm_engine import run_all
+from core.utils.llm_batch import PromptBatcher
 console = Console()
 
 # ! You can modify your own weights here
@@ -30,16 +32,31 @@ def calc_len(text: str) -> float:
 
     return sum(char_weight(char) for char in text)
 
-def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
-    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
-    
-    def valid_align(response_data):
-        if 'align' not in response_data:
-            return {"status": "error", "message": "Missing required key: `align`"}
-        if len(response_data['align']) < 2:
-            return {"status": "error", "message": "Align does not contain more than 1 part as expected!"}
-        return {"status": "success", "message": "Align completed"}
-    parsed = ask_gpt(align_prompt, resp_type='json', valid_def=valid_align, log_title='align_subs')
+def valid_align(response_data):
+    if 'align' not in response_data:
+        return {"status": "error", "message": "Missing required key: `align`"}
+    if len(response_data['align']) < 2:
+        return {"status": "error", "message": "Align does not contain more than 1 part as expected!"}
+    return {"status": "success", "message": "Align completed"}
+
+def _valid_align_item(payload, response_data):
+    valid = valid_align(response_data)
+    if valid['status'] != 'success':
+        return valid
+    # a batched answer may mix up parts between subtitles, so also check every part is there
+    num_parts = len(payload[2].split('\n'))
+    if len(response_data['align']) != num_parts or any(f'target_part_{i+1}' not in item for i, item in enumerate(response_data['align'])):
+        return {"status": "error", "message": f"Align should contain exactly {num_parts} target parts"}
+    return valid
+
+async def _ask_align(payload):
+    return await ask_gpt_async(get_align_prompt(*payload), resp_type='json', valid_def=valid_align, log_title='align_subs',
+                               stream_check=stream_expect_keys(['align'], allowed_keys=['analysis']))
+
+align_batcher = PromptBatcher("align", "align_subs", get_align_batch_prompt, _valid_align_item, _ask_align)
+
+async def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
+    parsed = await align_batcher.submit((src_sub, tr_sub, src_part))
     align_data = parsed['align']
     src_parts = src_part.split('\n')
     tr_parts = [item[f'target_part_{i+1}'].strip() for i, item in enumerate(align_data)]
@@ -77,15 +94,15 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]):
             console.print(table)
     
     @except_handler("Error in split_align_subs")
-    def process(i):
-        split_src = split_sentence(src_lines[i], num_parts=2).strip()
-        src_parts, tr_parts, tr_remerged = align_subs(src_lines[i], tr_lines[i], split_src)
+    async def process(i):
+        split_src = (await split_sentence_async(src_lines[i], num_parts=2)).strip()
+        src_parts, tr_parts, tr_remerged = await align_subs(src_lines[i], tr_lines[i], split_src)
         src_lines[i] = src_parts
         tr_lines[i] = tr_parts
         remerged_tr_lines[i] = tr_remerged
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-        executor.map(process, to_split)
+    # failed lines stay unsplit and are retried by the next split attempt
+    run_all([process(i) for i in to_split], return_exceptions=True)
     
     # Flatten `src_lines` and `tr_lines`
     src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
@@ -124,6 +141,7 @@ def split_for_sub_main():
     
     pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(_5_SPLIT_SUB, index=False)
     pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(_5_REMERGED, index=False)
+    report_llm_stats(['split_by_meaning', 'align_subs'])
 
 if __name__ == '__main__':
     split_for_sub_main()
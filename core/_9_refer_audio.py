@@ -8,6 +8,8 @@ import pandas as pd
 import soundfile as sf
 console = Console()
 from core.asr_backend.demucs_vl import demucs_audio
+from core.asr_backend.audio_preprocess import normalize_audio_volume
+from core.asr_backend.pcm_cache import SAMPLE_RATE, load_pcm
 from core.utils.models import *
 
 def time_to_samples(time_str, sr):
@@ -24,7 +26,11 @@ def extract_audio(audio_data, sr, start_time, end_time, out_file):
     sf.write(out_file, audio_data[start:end], sr)
 
 def extract_refer_audio_main():
+    # an ASR cache hit skips Demucs: separate now, normalized like _2_asr does, so the reference clips match a full run
+    separated_here = load_key("demucs") and not os.path.exists(_VOCAL_AUDIO_FILE)
     demucs_audio() #!!! in case demucs not run
+    if separated_here:
+        normalize_audio_volume(_VOCAL_AUDIO_FILE, _VOCAL_AUDIO_FILE, format="mp3")
     if os.path.exists(os.path.join(_AUDIO_SEGS_DIR, '1.wav')):
         rprint(Panel("Audio segments already exist, skipping extraction", title="Info", border_style="blue"))
         return
@@ -34,7 +40,8 @@ def extract_refer_audio_main():
     
     # Read task file and audio data
     df = pd.read_excel(_8_1_AUDIO_TASK)
-    data, sr = sf.read(_VOCAL_AUDIO_FILE)
+    # 16 kHz mono view of the vocals (decoded once for ASR already), vocal.mp3 holds nothing above the 16 kHz raw.mp3 anyway
+    data, sr = load_pcm(_VOCAL_AUDIO_FILE), SAMPLE_RATE
     
     with Progress(
         SpinnerColumn(),
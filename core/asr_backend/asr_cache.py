@@ -0,0 +1,94 @@
+import os
+import gzip
+import json
+import glob
+import hashlib
+import threading
+from rich import print as rprint
+from core.utils.config_utils import load_key
+from core.asr_backend.pcm_cache import load_pcm
+
+# ------------
+# ASR result cache shared by every job on the machine: word-level results keyed by the decoded audio and the ASR settings,
+# kept outside output/ so cleanup() does not move it away. A hit skips Demucs and transcription.
+# ------------
+
+CACHE_VERSION = 1  # bump when the stored result format changes
+_lock = threading.Lock()
+
+def audio_hash(audio_file):
+    """sha256 of the decoded 16 kHz PCM, so the same sound hashes the same whatever container or tags it came in"""
+    samples = load_pcm(audio_file)
+    digest = hashlib.sha256()
+    block = 1 << 22
+    for i in range(0, len(samples), block):
+        digest.update(memoryview(samples[i:i + block]))
+    return digest.hexdigest()
+
+def asr_settings():
+    """Everything besides the audio that changes the words or their timestamps"""
+    runtime = load_key("whisper.runtime")
+    return {
+        "version": CACHE_VERSION,
+        "runtime": runtime,
+        "model": load_key("whisper.model") if runtime == "local" else runtime,
+        "language": load_key("whisper.language"),
+        # the vocal track is what gets aligned (and what the cloud backends hear)
+        "demucs": bool(load_key("demucs")),
+    }
+
+def cache_key(audio_file):
+    payload = json.dumps([audio_hash(audio_file), asr_settings()], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _path(key):
+    return os.path.join(load_key("asr_cache.dir"), key[:2], f"{key}.json.gz")
+
+def load_cached(key):
+    """The cached {"language", "segments"} for key, or None"""
+    if not load_key("asr_cache.enabled"):
+        return None
+    path = _path(key)
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        rprint(f"[yellow]⚠️ Ignoring unreadable ASR cache entry {path}: {e}[/yellow]")
+        return None
+    os.utime(path)  # mtime is the last access, see _evict_lru
+    return cached
+
+def save_cached(key, result, language):
+    if not load_key("asr_cache.enabled"):
+        return
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # other jobs may read the same key, only complete files are ever renamed into place
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump({"language": language, "segments": result["segments"]}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _evict_lru()
+
+def _evict_lru():
+    """Drop least recently used results until the cache fits in asr_cache.max_size_mb"""
+    max_bytes = load_key("asr_cache.max_size_mb") * 1024 * 1024
+    with _lock:
+        entries = []
+        for path in glob.glob(os.path.join(load_key("asr_cache.dir"), "*", "*.json.gz")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,12 +1,12 @@
 import os, subprocess
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple
 from pydub import AudioSegment
 from core.utils import *
 from core.utils.models import *
 from pydub import AudioSegment
-from pydub.silence import detect_silence
-from pydub.utils import mediainfo
+from core.asr_backend.pcm_cache import SAMPLE_RATE, load_pcm
 from rich import print as rprint
 
 def normalize_audio_volume(audio_path, output_path, target_db = -20.0, format = "wav"):
@@ -46,15 +46,60 @@ def get_audio_duration(audio_file: str) -> float:
         duration = 0
     return duration
 
+# ------------
+# silence detection on the decoded PCM: pydub's detect_silence, vectorized and streamed in blocks
+# ------------
+
+def silent_runs(samples, min_silence_len=500, silence_thresh=-30, block_ms=60_000):
+    """Runs [first, last] (ms) of consecutive window starts i whose window [i, i + min_silence_len) ms is silent,
+    with pydub's rule: int(rms) <= 10 ** (silence_thresh / 20) * 32768. Reads `block_ms` of audio at a time, so memory stays bounded."""
+    spm = SAMPLE_RATE // 1000  # samples per ms
+    total_ms = len(samples) // spm
+    threshold = 10 ** (silence_thresh / 20) * 32768
+    runs = []
+    for block_start in range(0, max(0, total_ms - min_silence_len + 1), block_ms):
+        # window starts of this block, plus the audio their windows reach into
+        starts_end = min(block_start + block_ms, total_ms - min_silence_len + 1)
+        chunk = np.asarray(samples[block_start * spm:(starts_end - 1 + min_silence_len) * spm], dtype=np.int64)
+        energy = np.concatenate(([0], np.cumsum((chunk * chunk).reshape(-1, spm).sum(axis=1))))
+        window_energy = energy[min_silence_len:] - energy[:-min_silence_len]
+        silent = np.floor(np.sqrt(window_energy / (min_silence_len * spm))) <= threshold
+        # edges of the runs of silent window starts
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+        for first, stop in zip(edges[::2] + block_start, edges[1::2] + block_start):
+            if runs and runs[-1][1] == first - 1:
+                runs[-1][1] = stop - 1  # continues over the block boundary
+            else:
+                runs.append([first, stop - 1])
+    return runs
+
+def silence_ranges(runs, min_silence_len, lo, hi):
+    """What detect_silence(audio[lo:hi], min_silence_len) returns, in ms relative to lo:
+    window starts that fit inside [lo, hi), grouped while the gap between starts is at most min_silence_len"""
+    ranges = []
+    for first, last in runs:
+        first, last = max(first, lo), min(last, hi - min_silence_len)
+        if first > last:
+            continue
+        # ranges[-1][1] - min_silence_len is the previous silent window start
+        if ranges and first - (ranges[-1][1] - min_silence_len) <= min_silence_len:
+            ranges[-1][1] = last + min_silence_len
+        else:
+            ranges.append([first, last + min_silence_len])
+    return [(start - lo, end - lo) for start, end in ranges]
+
 def split_audio(audio_file: str, target_len: float = 30*60, win: float = 60) -> List[Tuple[float, float]]:
-    ## 在 [target_len-win, target_len+win] 区间内用 pydub 检测静默，切分音频
+    ## 在 [target_len-win, target_len+win] 区间内检测静默，切分音频
     rprint(f"[blue]🎙️ Starting audio segmentation {audio_file} {target_len} {win}[/blue]")
-    audio = AudioSegment.from_file(audio_file)
-    duration = float(mediainfo(audio_file)["duration"])
+    samples = load_pcm(audio_file)
+    duration = len(samples) / SAMPLE_RATE
     if duration <= target_len + win:
         return [(0, duration)]
     segments, pos = [], 0.0
     safe_margin = 0.5  # 静默点前后安全边界，单位秒
+    # one pass over the whole file, any target length can then be cut from it
+    min_silence_len = int(safe_margin*1000)
+    runs = silent_runs(samples, min_silence_len=min_silence_len, silence_thresh=-30)
 
     while pos < duration:
         if duration - pos <= target_len:
@@ -64,7 +109,7 @@ def split_audio(audio_file: str, target_len: float = 30*60, win: float = 60) ->
         ws, we = int((threshold - win) * 1000), int((threshold + win) * 1000)
         
         # 获取完整的静默区域
-        silence_regions = detect_silence(audio[ws:we], min_silence_len=int(safe_margin*1000), silence_thresh=-30)
+        silence_regions = silence_ranges(runs, min_silence_len, ws, min(we, len(samples) * 1000 // SAMPLE_RATE))
         silence_regions = [(s/1000 + (threshold - win), e/1000 + (threshold - win)) for s, e in silence_regions]
         # 筛选长度足够（至少1秒）且位置适合的静默区域
         valid_regions = [
@@ -156,4 +201,4 @@ def save_results(df: pd.DataFrame):
     rprint(f"[green]📊 Excel file saved to {_2_CLEANED_CHUNKS}[/green]")
 
 def save_language(language: str):
-    update_key("whisper.detected_language", language)
\ No newline at end of file
+    set_job_key("whisper.detected_language", language)
\ No newline at end of file
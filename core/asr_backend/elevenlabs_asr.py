@@ -3,10 +3,10 @@ import json
 import time
 import requests
 import tempfile
-import librosa
 import soundfile as sf
 from rich import print as rprint
 from core.utils import *
+from core.asr_backend.pcm_cache import SAMPLE_RATE, pcm_duration, pcm_slice
 
 # ----------------------------------------
 # ISO 639-2 to 1
@@ -71,23 +71,18 @@ def transcribe_audio_elevenlabs(raw_audio_path, vocal_audio_path, start = None,
         with open(LOG_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
     
-    # Load audio and process start/end parameters
-    y, sr = librosa.load(vocal_audio_path, sr=16000)
-    audio_duration = len(y) / sr
-    
+    # Process start/end parameters
     if start is None or end is None:
         start = 0
-        end = audio_duration
+        end = pcm_duration(vocal_audio_path)
     
-    # Slice audio based on start/end
-    start_sample = int(start * sr)
-    end_sample = int(end * sr)
-    y_slice = y[start_sample:end_sample]
+    # Slice audio based on start/end, a view of the decoded PCM cache
+    y_slice = pcm_slice(vocal_audio_path, start, end)
     
     # Create temporary file for the sliced audio
     with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
         temp_filepath = temp_file.name
-        sf.write(temp_filepath, y_slice, sr, format='MP3')
+        sf.write(temp_filepath, y_slice, SAMPLE_RATE, format='MP3')
     
     try:
         api_key = load_key("whisper.elevenlabs_api_key")
@@ -113,7 +108,7 @@ def transcribe_audio_elevenlabs(raw_audio_path, vocal_audio_path, start = None,
 
         # save detected language
         detected_language = iso_639_2_to_1.get(result["language_code"], result["language_code"])
-        update_key("whisper.detected_language", detected_language)
+        set_job_key("whisper.detected_language", detected_language)
 
         # Adjust timestamps for all words by adding the start time
         if start is not None and 'words' in result:
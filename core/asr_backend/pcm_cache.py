@@ -0,0 +1,65 @@
+import os
+import subprocess
+import threading
+import numpy as np
+from rich import print as rprint
+
+# ------------
+# decoded PCM cache: each audio file is decoded once to 16 kHz mono int16 next to it,
+# every reader (ASR backends, silence search, reference audio) memory-maps that file instead of decoding the MP3 again
+# ------------
+
+SAMPLE_RATE = 16000
+_lock = threading.Lock()
+_maps = {}  # pcm path -> ((mtime_ns, size), memmap)
+
+def pcm_path(audio_file):
+    return os.path.splitext(audio_file)[0] + ".16k.s16le"
+
+def ensure_pcm(audio_file):
+    """Decode audio_file with FFmpeg unless its PCM file is newer than it (e.g. vocal.mp3 normalized again), return the PCM path"""
+    path = pcm_path(audio_file)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(audio_file):
+        return path
+    rprint(f"[blue]🎵 Decoding <{audio_file}> to 16 kHz PCM once...[/blue]")
+    # other processes (sharded ASR workers) may decode the same file, only complete files are ever renamed into place
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    subprocess.run(['ffmpeg', '-y', '-i', audio_file, '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE),
+                    '-f', 's16le', '-acodec', 'pcm_s16le', tmp_path], check=True, stderr=subprocess.PIPE)
+    os.replace(tmp_path, path)
+    return path
+
+def load_pcm(audio_file):
+    """Read-only int16 memmap of the whole file, slicing it gives views: no copy, no decode"""
+    with _lock:
+        path = ensure_pcm(audio_file)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = _maps.get(path)
+        if cached is None or cached[0] != signature:
+            # np.memmap refuses empty files
+            samples = np.memmap(path, dtype=np.int16, mode='r') if stat.st_size else np.zeros(0, dtype=np.int16)
+            cached = _maps[path] = (signature, samples)
+        return cached[1]
+
+def release_pcm(audio_file=None):
+    """Drop the memmaps of audio_file (all of them by default) so the PCM files can be deleted or moved.
+    The file is unmapped once the last view of it is gone: closing the mmap under a live view would crash the reader instead."""
+    with _lock:
+        paths = list(_maps) if audio_file is None else [pcm_path(audio_file)]
+        for path in paths:
+            _maps.pop(path, None)
+
+def pcm_duration(audio_file):
+    return len(load_pcm(audio_file)) / SAMPLE_RATE
+
+def pcm_slice(audio_file, start=None, end=None):
+    """int16 view of [start, end) seconds"""
+    samples = load_pcm(audio_file)
+    first = 0 if start is None else max(0, int(start * SAMPLE_RATE))
+    last = len(samples) if end is None else min(len(samples), int(end * SAMPLE_RATE))
+    return samples[first:last]
+
+def pcm_float(audio_file, start=None, end=None):
+    """float32 samples in [-1, 1) as the Whisper models expect, the only copy that is made"""
+    return np.multiply(pcm_slice(audio_file, start, end), 1 / 32768, dtype=np.float32)
@@ -3,11 +3,11 @@ import io
 import json
 import time
 import requests
-import librosa
 import soundfile as sf
 from rich import print as rprint
 from core.utils import *
 from core.utils.models import *
+from core.asr_backend.pcm_cache import SAMPLE_RATE, pcm_duration, pcm_slice
 
 OUTPUT_LOG_DIR = "output/log"
 def transcribe_audio_302(raw_audio_path: str, vocal_audio_path: str, start: float = None, end: float = None):
@@ -18,22 +18,16 @@ def transcribe_audio_302(raw_audio_path: str, vocal_audio_path: str, start: floa
             return json.load(f)
         
     WHISPER_LANGUAGE = load_key("whisper.language")
-    update_key("whisper.language", WHISPER_LANGUAGE)
     url = "https://api.302.ai/302/whisperx"
     
-    y, sr = librosa.load(vocal_audio_path, sr=16000)
-    audio_duration = len(y) / sr
-    
     if start is None or end is None:
         start = 0
-        end = audio_duration
-        
-    start_sample = int(start * sr)
-    end_sample = int(end * sr)
-    y_slice = y[start_sample:end_sample]
+        end = pcm_duration(vocal_audio_path)
+    # a view of the decoded PCM cache, written out as 16-bit WAV as is
+    y_slice = pcm_slice(vocal_audio_path, start, end)
     
     audio_buffer = io.BytesIO()
-    sf.write(audio_buffer, y_slice, sr, format='WAV', subtype='PCM_16')
+    sf.write(audio_buffer, y_slice, SAMPLE_RATE, format='WAV', subtype='PCM_16')
     audio_buffer.seek(0)
     
     files = [('audio_input', ('audio_slice.wav', audio_buffer, 'application/octet-stream'))]
@@ -2,11 +2,18 @@ import os
 import warnings
 import time
 import subprocess
+import queue
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import torch
 import whisperx
-import librosa
+import numpy as np
 from rich import print as rprint
+from rich.table import Table
 from core.utils import *
+from core.asr_backend.pcm_cache import ensure_pcm, pcm_duration, pcm_float
 
 warnings.filterwarnings("ignore")
 MODEL_DIR = load_key("model_dir")
@@ -35,88 +42,370 @@ def check_hf_mirror():
     rprint(f"[cyan]🚀 Selected mirror:[/cyan] {fastest_url} ({best_time:.2f}s)")
     return fastest_url
 
+# ------------
+# one session per transcription: mirror resolved once, ASR and align models kept loaded across segments
+# ------------
+
+class WhisperXSession:
+    def __init__(self, threads=None, check_mirror=True):
+        """threads: CPU threads for the Whisper and align models, None keeps the library defaults.
+        check_mirror=False for worker processes that inherit HF_ENDPOINT from the parent"""
+        self.load_times = {}
+        self.segment_times = []
+        self.model = None
+        self.align_models = {}  # language -> (model, metadata)
+        self.wall = None
+        self.threads = threads
+        if threads:
+            torch.set_num_threads(threads)
+
+        if check_mirror:
+            start = time.time()
+            mirror = check_hf_mirror()
+            if mirror:
+                os.environ['HF_ENDPOINT'] = mirror
+            self.load_times["mirror check"] = time.time() - start
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        rprint(f"🚀 Starting WhisperX using device: {self.device} ...")
+        if self.device == "cuda":
+            gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+            self.batch_size = 16 if gpu_mem > 8 else 2
+            self.compute_type = "float16" if torch.cuda.is_bf16_supported() else "int8"
+            rprint(f"[cyan]🎮 GPU memory:[/cyan] {gpu_mem:.2f} GB, [cyan]📦 Batch size:[/cyan] {self.batch_size}, [cyan]⚙️ Compute type:[/cyan] {self.compute_type}")
+        else:
+            self.batch_size = 1
+            self.compute_type = "int8"
+            rprint(f"[cyan]📦 Batch size:[/cyan] {self.batch_size}, [cyan]⚙️ Compute type:[/cyan] {self.compute_type}")
+
+    def _load_model(self):
+        # the language set by the user decides the model, later segments may only narrow 'auto' down to the detected language
+        WHISPER_LANGUAGE = load_key("whisper.language")
+        if WHISPER_LANGUAGE == 'zh':
+            model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
+            local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
+        else:
+            model_name = load_key("whisper.model")
+            local_model = os.path.join(MODEL_DIR, model_name)
+
+        if os.path.exists(local_model):
+            rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
+            model_name = local_model
+        else:
+            rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
+
+        vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
+        asr_options = {"temperatures": [0],"initial_prompt": "",}
+        whisper_language = None if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
+        rprint("[bold yellow] You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`[/bold yellow]")
+        start = time.time()
+        threads = {"threads": self.threads} if self.threads else {}
+        self.model = whisperx.load_model(model_name, self.device, compute_type=self.compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR, **threads)
+        self.load_times["whisper model"] = time.time() - start
+        self.user_language = WHISPER_LANGUAGE
+
+    def _align_model(self, language):
+        if language not in self.align_models:
+            start = time.time()
+            self.align_models[language] = whisperx.load_align_model(language_code=language, device=self.device)
+            self.load_times[f"align model ({language})"] = time.time() - start
+        return self.align_models[language]
+
+    def decode(self, raw_audio_file, vocal_audio_file, start, end):
+        times = {"segment": f"{start:.0f}s-{end:.0f}s"}
+        load_start = time.time()
+        # slices of the decoded PCM cache, converted to float32
+        raw_audio_segment = pcm_float(raw_audio_file, start, end)
+        vocal_audio_segment = pcm_float(vocal_audio_file, start, end)
+        times["audio load"] = time.time() - load_start
+        return raw_audio_segment, vocal_audio_segment, times
+
+    def asr(self, raw_audio_segment, start, end, times):
+        rprint(f"[green]▶️ Starting WhisperX for segment {start:.2f}s to {end:.2f}s...[/green]")
+        if self.model is None:
+            self._load_model()
+        transcribe_start_time = time.time()
+        rprint("[bold green]Note: You will see Progress if working correctly ↓[/bold green]")
+        # after the first segment whisper.language holds the detected language, so 'auto' is only detected once
+        language = load_key("whisper.language")
+        result = self.model.transcribe(raw_audio_segment, batch_size=self.batch_size, print_progress=True, language=None if 'auto' in language else language)
+        times["transcribe"] = time.time() - transcribe_start_time
+        rprint(f"[cyan]⏱️ time transcribe:[/cyan] {times['transcribe']:.2f}s")
+
+        # Save language for this job only, once: probe_language normally recorded it already
+        if 'auto' in language:
+            set_job_key("whisper.language", result['language'])
+            set_job_key("whisper.detected_language", result['language'])
+        if result['language'] == 'zh' and self.user_language != 'zh':
+            raise ValueError("Please specify the transcription language as zh and try again!")
+        return result
+
+    def align(self, result, vocal_audio_segment, start, times):
+        model_a, metadata = self._align_model(result["language"])
+        align_start_time = time.time()
+        # Align timestamps using vocal audio
+        result = whisperx.align(result["segments"], model_a, metadata, vocal_audio_segment, self.device, return_char_alignments=False)
+        times["align"] = time.time() - align_start_time
+        rprint(f"[cyan]⏱️ time align:[/cyan] {times['align']:.2f}s")
+        self.segment_times.append(times)
+
+        # Adjust timestamps
+        for segment in result['segments']:
+            segment['start'] += start
+            segment['end'] += start
+            for word in segment['words']:
+                if 'start' in word:
+                    word['start'] += start
+                if 'end' in word:
+                    word['end'] += start
+        return result
+
+    def transcribe(self, raw_audio_file, vocal_audio_file, start, end):
+        raw_audio_segment, vocal_audio_segment, times = self.decode(raw_audio_file, vocal_audio_file, start, end)
+        # 1. transcribe raw audio, 2. align by vocal audio
+        result = self.asr(raw_audio_segment, start, end, times)
+        return self.align(result, vocal_audio_segment, start, times)
+
+    def transcribe_segments(self, raw_audio_file, vocal_audio_file, segments, depth=2, on_result=None):
+        """Pipelined transcription: segment N+1 is decoded while N transcribes, and N is aligned while N+1 transcribes.
+        At most `depth` segments wait between two stages, so memory does not grow with the length of the input.
+        on_result(index, result) is called on the align thread as each segment is done, in segment order."""
+        decoded, transcribed = queue.Queue(maxsize=depth), queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        results, errors = [None] * len(segments), []
+
+        def put(q, item):
+            # give up once another stage failed, nobody would take the item
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            return None
+
+        @bind_job_config
+        def decode_worker():
+            try:
+                for i, (start, end) in enumerate(segments):
+                    if not put(decoded, (i, start, end, *self.decode(raw_audio_file, vocal_audio_file, start, end))):
+                        return
+                put(decoded, None)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        @bind_job_config
+        def align_worker():
+            try:
+                while True:
+                    item = get(transcribed)
+                    if item is None:
+                        return
+                    i, start, result, vocal_audio_segment, times = item
+                    results[i] = self.align(result, vocal_audio_segment, start, times)
+                    if on_result is not None:
+                        on_result(i, results[i])
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        wall_start = time.time()
+        workers = [threading.Thread(target=decode_worker, name="asr-decode", daemon=True), threading.Thread(target=align_worker, name="asr-align", daemon=True)]
+        for worker in workers:
+            worker.start()
+        try:
+            # the Whisper model runs on this thread, one segment at a time
+            while True:
+                item = get(decoded)
+                if item is None:
+                    break
+                i, start, end, raw_audio_segment, vocal_audio_segment, times = item
+                result = self.asr(raw_audio_segment, start, end, times)
+                del raw_audio_segment
+                if not put(transcribed, (i, start, result, vocal_audio_segment, times)):
+                    break
+            put(transcribed, None)
+        except Exception:
+            stop.set()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+        self.wall = time.time() - wall_start
+        return results
+
+    def report(self):
+        table = Table(title="⏱️ WhisperX session")
+        for column in ("step", "load", "audio", "transcribe", "align"):
+            table.add_column(column)
+        for name, seconds in self.load_times.items():
+            table.add_row(name, f"{seconds:.2f}s", "", "", "")
+        for times in self.segment_times:
+            table.add_row(f"segment {times['segment']}", "", f"{times['audio load']:.2f}s", f"{times['transcribe']:.2f}s", f"{times['align']:.2f}s")
+        rprint(table)
+        load = sum(self.load_times.values())
+        compute = sum(t["audio load"] + t["transcribe"] + t["align"] for t in self.segment_times)
+        rprint(f"[cyan]WhisperX:[/cyan] {load:.1f}s loading (once per run), {compute:.1f}s computing {len(self.segment_times)} segments")
+        if self.wall is not None:
+            rprint(f"[cyan]Pipelined:[/cyan] {self.wall:.1f}s wall time for {compute + self.load_times.get('whisper model', 0.0):.1f}s of serial work")
+
+    def close(self):
+        # Free GPU resources
+        del self.model
+        self.model = None
+        self.align_models.clear()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+
+_session = None
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = WhisperXSession()
+    return _session
+
+def close_session():
+    """Report load vs compute time and free the models, call once all segments are transcribed"""
+    global _session
+    if _session is not None:
+        _session.report()
+        _session.close()
+        _session = None
+
+@except_handler("WhisperX processing error:")
+def transcribe_segments(raw_audio_file, vocal_audio_file, segments, on_result=None):
+    return get_session().transcribe_segments(raw_audio_file, vocal_audio_file, segments, depth=load_key("whisper.pipeline_depth"), on_result=on_result)
+
 @except_handler("WhisperX processing error:")
 def transcribe_audio(raw_audio_file, vocal_audio_file, start, end):
-    os.environ['HF_ENDPOINT'] = check_hf_mirror()
-    WHISPER_LANGUAGE = load_key("whisper.language")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    rprint(f"🚀 Starting WhisperX using device: {device} ...")
-    
-    if device == "cuda":
-        gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-        batch_size = 16 if gpu_mem > 8 else 2
-        compute_type = "float16" if torch.cuda.is_bf16_supported() else "int8"
-        rprint(f"[cyan]🎮 GPU memory:[/cyan] {gpu_mem:.2f} GB, [cyan]📦 Batch size:[/cyan] {batch_size}, [cyan]⚙️ Compute type:[/cyan] {compute_type}")
-    else:
-        batch_size = 1
-        compute_type = "int8"
-        rprint(f"[cyan]📦 Batch size:[/cyan] {batch_size}, [cyan]⚙️ Compute type:[/cyan] {compute_type}")
-    rprint(f"[green]▶️ Starting WhisperX for segment {start:.2f}s to {end:.2f}s...[/green]")
-    
-    if WHISPER_LANGUAGE == 'zh':
-        model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
-        local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
-    else:
-        model_name = load_key("whisper.model")
-        local_model = os.path.join(MODEL_DIR, model_name)
-        
-    if os.path.exists(local_model):
-        rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
-        model_name = local_model
-    else:
-        rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
-
-    vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
-    asr_options = {"temperatures": [0],"initial_prompt": "",}
-    whisper_language = None if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
-    rprint("[bold yellow] You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`[/bold yellow]")
-    model = whisperx.load_model(model_name, device, compute_type=compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR)
-
-    def load_audio_segment(audio_file, start, end):
-        audio, _ = librosa.load(audio_file, sr=16000, offset=start, duration=end - start, mono=True)
-        return audio
-    raw_audio_segment = load_audio_segment(raw_audio_file, start, end)
-    vocal_audio_segment = load_audio_segment(vocal_audio_file, start, end)
-    
-    # -------------------------
-    # 1. transcribe raw audio
-    # -------------------------
-    transcribe_start_time = time.time()
-    rprint("[bold green]Note: You will see Progress if working correctly ↓[/bold green]")
-    result = model.transcribe(raw_audio_segment, batch_size=batch_size, print_progress=True)
-    transcribe_time = time.time() - transcribe_start_time
-    rprint(f"[cyan]⏱️ time transcribe:[/cyan] {transcribe_time:.2f}s")
-
-    # Free GPU resources
-    del model
-    torch.cuda.empty_cache()
-
-    # Save language
-    update_key("whisper.language", result['language'])
-    if result['language'] == 'zh' and WHISPER_LANGUAGE != 'zh':
-        raise ValueError("Please specify the transcription language as zh and try again!")
-
-    # -------------------------
-    # 2. align by vocal audio
-    # -------------------------
-    align_start_time = time.time()
-    # Align timestamps using vocal audio
-    model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=device)
-    result = whisperx.align(result["segments"], model_a, metadata, vocal_audio_segment, device, return_char_alignments=False)
-    align_time = time.time() - align_start_time
-    rprint(f"[cyan]⏱️ time align:[/cyan] {align_time:.2f}s")
-
-    # Free GPU resources again
-    torch.cuda.empty_cache()
-    del model_a
-
-    # Adjust timestamps
-    for segment in result['segments']:
-        segment['start'] += start
-        segment['end'] += start
-        for word in segment['words']:
-            if 'start' in word:
-                word['start'] += start
-            if 'end' in word:
-                word['end'] += start
-    return result
\ No newline at end of file
+    return get_session().transcribe(raw_audio_file, vocal_audio_file, start, end)
+
+# ------------
+# language probe: language ID on a few speech windows before the full pass, so 'auto' picks the right model up front
+# ------------
+
+def _speech_windows(audio_file, count, window_len=30, candidates=8):
+    """The `count` windows (of `candidates` spread over the audio) with the most frames above an energy threshold"""
+    duration = pcm_duration(audio_file)
+    last = max(0.0, duration - window_len)
+    offsets = sorted({last * i / max(1, candidates - 1) for i in range(candidates)})
+    scored = []
+    for offset in offsets:
+        audio = pcm_float(audio_file, offset, offset + window_len)
+        frames = audio[:len(audio) // 480 * 480].reshape(-1, 480)  # 30 ms frames
+        if not len(frames):
+            continue
+        db = 20 * np.log10(np.sqrt((frames ** 2).mean(axis=1)) + 1e-10)
+        # speech: clearly above the noise floor of the window, and never below -45 dBFS
+        threshold = max(-45.0, np.percentile(db, 10) + 10)
+        scored.append(((db > threshold).mean(), offset, audio))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored[:count]
+
+def probe_language(audio_file, keep_model=True):
+    """Detect the spoken language of an 'auto' job and record it once, before any segment is transcribed.
+    A zh result switches the session to the Belle zh model. keep_model=False frees the model afterwards (sharded workers load their own)."""
+    global _session
+    language = load_key("whisper.language")
+    if 'auto' not in language:
+        set_job_key("whisper.detected_language", language)
+        return language
+    try:
+        session = get_session()
+        if session.model is None:
+            session._load_model()
+        start = time.time()
+        windows = _speech_windows(audio_file, load_key("whisper.probe_windows"))
+        votes = Counter(session.model.detect_language(audio) for _, _, audio in windows)
+        language = votes.most_common(1)[0][0]
+        session.load_times["language probe"] = time.time() - start
+    except Exception as e:
+        rprint(f"[yellow]⚠️ Language probe failed, the language will be detected while transcribing: {e}[/yellow]")
+        return None
+    rprint(f"[green]🌐 Detected language {language} on {len(windows)} speech windows ({dict(votes)}) in {session.load_times['language probe']:.1f}s[/green]")
+    set_job_key("whisper.language", language)
+    set_job_key("whisper.detected_language", language)
+    if keep_model and language == 'zh' and session.user_language != 'zh':
+        session.model = None
+        session._load_model()
+    if not keep_model:
+        session.close()
+        _session = None
+    return language
+
+# ------------
+# CPU sharding: hosts without GPU transcribe short shards in parallel worker processes
+# ------------
+
+def shard_workers():
+    """Worker processes for sharded CPU transcription, 0 when it does not apply (GPU available or disabled)"""
+    shards = load_key("whisper.cpu_shards")
+    if not shards["enabled"] or torch.cuda.is_available():
+        return 0
+    cores = os.cpu_count() or 1
+    # ctranslate2 scales well up to about 4 threads per model, more cores are better spent on more processes
+    workers = shards["workers"] or cores // 4
+    return max(1, min(workers, cores))
+
+def _transcribe_shard(raw_audio_file, vocal_audio_file, start, end, job_values, threads):
+    """Runs in a worker process, its session (and models) is reused for every shard the process gets"""
+    global _session
+    with job_config(job_values, manifest=None):
+        if _session is None:
+            _session = WhisperXSession(threads=threads, check_mirror=False)
+        result = _session.transcribe(raw_audio_file, vocal_audio_file, start, end)
+        return result, load_key("whisper.detected_language"), _session.segment_times[-1]
+
+@except_handler("WhisperX processing error:")
+def transcribe_shards(raw_audio_file, vocal_audio_file, shards, workers, on_result=None):
+    """Transcribe silence-cut shards in `workers` processes with cores // workers threads each,
+    results come back in shard order with timestamps already shifted to the full audio.
+    on_result(index, result) is called as soon as a shard and all shards before it are done."""
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    rprint(f"[cyan]🧩 Transcribing {len(shards)} shards on CPU with {workers} processes x {threads} threads...[/cyan]")
+    mirror = check_hf_mirror()
+    if mirror:
+        os.environ['HF_ENDPOINT'] = mirror  # inherited by the workers
+    job_values = get_job_values()
+    # decode once here, the workers only map the PCM files
+    ensure_pcm(raw_audio_file)
+    ensure_pcm(vocal_audio_file)
+
+    wall_start = time.time()
+    # spawn: torch and ctranslate2 thread pools do not survive fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_transcribe_shard, raw_audio_file, vocal_audio_file, start, end, job_values, threads) for start, end in shards]
+        outputs = []
+        for i, future in enumerate(futures):
+            outputs.append(future.result())
+            if on_result is not None:
+                on_result(i, outputs[-1][0])
+    wall = time.time() - wall_start
+
+    # with 'auto' left (no language probe) every shard detects its language, the job keeps the most common one
+    if 'auto' in load_key("whisper.language"):
+        language, _ = Counter(lang for _, lang, _ in outputs).most_common(1)[0]
+        set_job_key("whisper.language", language)
+        set_job_key("whisper.detected_language", language)
+
+    table = Table(title="⏱️ Sharded WhisperX")
+    for column in ("shard", "language", "audio", "transcribe", "align"):
+        table.add_column(column)
+    for _, lang, times in outputs:
+        table.add_row(times["segment"], lang, f"{times['audio load']:.2f}s", f"{times['transcribe']:.2f}s", f"{times['align']:.2f}s")
+    rprint(table)
+    compute = sum(t["audio load"] + t["transcribe"] + t["align"] for _, _, t in outputs)
+    rprint(f"[cyan]Sharded:[/cyan] {wall:.1f}s wall time for {compute:.1f}s of transcription work on {workers} processes")
+    return [result for result, _, _ in outputs]
@@ -43,6 +43,53 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 """.strip()
     return split_prompt
 
+def get_split_batch_prompt(items):
+    """items: {id: (sentence, num_parts, word_limit)}, answered as {id: {"split1", "split2", "choice"}}"""
+    language = load_key("whisper.detected_language")
+    sentences = '\n'.join(
+        f'<sentence id="{key}" parts="{num_parts}" word_limit="{word_limit}">\n{sentence}\n</sentence>'
+        for key, (sentence, num_parts, word_limit) in items.items()
+    )
+    first_key = next(iter(items))
+    split_batch_prompt = f"""
+## Role
+You are a professional Netflix subtitle splitter in **{language}**.
+
+## Task
+Split each given subtitle text into the number of parts given by its `parts` attribute, each part less than `word_limit` words.
+
+1. Maintain sentence meaning coherence according to Netflix subtitle standards
+2. MOST IMPORTANT: Keep parts roughly equal in length (minimum 3 words each)
+3. Split at natural points like punctuation marks or conjunctions
+4. If provided text is repeated words, simply split at the middle of the repeated words.
+5. Handle every sentence independently and answer for every id
+
+## Steps
+For each sentence:
+1. Generate two alternative splitting approaches with [br] tags at split positions
+2. Briefly compare both approaches
+3. Choose the best splitting approach
+
+## Given Texts
+{sentences}
+
+## Output in only JSON format and no other text
+```json
+{{
+    "{first_key}": {{
+        "split1": "First splitting approach with [br] tags at split positions",
+        "split2": "Alternative splitting approach with [br] tags at split positions",
+        "assess": "Brief comparison of both approaches",
+        "choice": "1 or 2"
+    }},
+    ...one entry per sentence id
+}}
+```
+
+Note: Start you answer with ```json and end with ```, do not add any other text.
+""".strip()
+    return split_batch_prompt
+
 """{{
     "analysis": "Brief analysis of the text structure",
     "split": "Complete sentence with [br] tags at split positions"
@@ -141,7 +188,7 @@ def generate_shared_prompt(previous_content_prompt, after_content_prompt, summar
 ### Points to Note
 {things_to_note_prompt}'''
 
-def get_prompt_faithfulness(lines, shared_prompt):
+def get_faithfulness_json_format(lines):
     TARGET_LANGUAGE = load_key("target_language")
     # Split lines by \n
     line_splits = lines.split('\n')
@@ -149,7 +196,11 @@ def get_prompt_faithfulness(lines, shared_prompt):
     json_dict = {}
     for i, line in enumerate(line_splits, 1):
         json_dict[f"{i}"] = {"origin": line, "direct": f"direct {TARGET_LANGUAGE} translation {i}."}
-    json_format = json.dumps(json_dict, indent=2, ensure_ascii=False)
+    return json.dumps(json_dict, indent=2, ensure_ascii=False)
+
+def get_prompt_faithfulness(lines, shared_prompt, json_format=None):
+    TARGET_LANGUAGE = load_key("target_language")
+    json_format = json_format or get_faithfulness_json_format(lines)
 
     src_language = load_key("whisper.detected_language")
     prompt_faithfulness = f'''
@@ -187,8 +238,7 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
     return prompt_faithfulness.strip()
 
 
-def get_prompt_expressiveness(faithfulness_result, lines, shared_prompt):
-    TARGET_LANGUAGE = load_key("target_language")
+def get_expressiveness_json_format(faithfulness_result):
     json_format = {
         key: {
             "origin": value["origin"],
@@ -198,7 +248,11 @@ def get_prompt_expressiveness(faithfulness_result, lines, shared_prompt):
         }
         for key, value in faithfulness_result.items()
     }
-    json_format = json.dumps(json_format, indent=2, ensure_ascii=False)
+    return json.dumps(json_format, indent=2, ensure_ascii=False)
+
+def get_prompt_expressiveness(faithfulness_result, lines, shared_prompt, json_format=None):
+    TARGET_LANGUAGE = load_key("target_language")
+    json_format = json_format or get_expressiveness_json_format(faithfulness_result)
 
     src_language = load_key("whisper.detected_language")
     prompt_expressiveness = f'''
@@ -246,6 +300,129 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 '''
     return prompt_expressiveness.strip()
 
+## ================================================================
+# @ translate_lines.py with translate_format: compact
+# The answer holds only the translations keyed by line number, nothing of the input is echoed back.
+# The line numbers (and the direct translations for the expressiveness step) move to the input instead.
+
+def get_numbered_lines(lines):
+    return '\n'.join(f'[{i}] {line}' for i, line in enumerate(lines.split('\n'), 1))
+
+def get_numbered_direct_lines(faithfulness_result):
+    return '\n'.join(f'[{key}] {value["origin"]}\n    direct: {value["direct"]}' for key, value in faithfulness_result.items())
+
+def get_compact_json_format(length, kind):
+    """kind: 'direct' or 'free'"""
+    TARGET_LANGUAGE = load_key("target_language")
+    json_dict = {f"{i}": f"{kind} {TARGET_LANGUAGE} translation of line {i}" for i in range(1, length + 1)}
+    return json.dumps(json_dict, indent=2, ensure_ascii=False)
+
+## ================================================================
+# @ translate_lines.py with prompt_layout: prefix_cache
+# The video-wide part (instructions, theme, full glossary) comes first and is byte-identical for every chunk,
+# so provider prompt caches and local prefix caching (vLLM, llama.cpp) can reuse it. Chunk-specific parts follow.
+
+def get_glossary_prompt(terms):
+    """All terms of the video, in the same order for every chunk"""
+    if not terms:
+        return "None"
+    return '\n'.join(f'{i+1}. "{term["src"]}": "{term["tgt"]}", meaning: {term["note"]}' for i, term in enumerate(terms))
+
+def get_prefix_faithfulness(summary_prompt, glossary_prompt):
+    TARGET_LANGUAGE = load_key("target_language")
+    src_language = load_key("whisper.detected_language")
+    return f'''
+## Role
+You are a professional Netflix subtitle translator, fluent in both {src_language} and {TARGET_LANGUAGE}, as well as their respective cultures. 
+Your expertise lies in accurately understanding the semantics and structure of the original {src_language} text and faithfully translating it into {TARGET_LANGUAGE} while preserving the original meaning.
+
+## Task
+We have a segment of original {src_language} subtitles that need to be directly translated into {TARGET_LANGUAGE}. These subtitles come from a specific context and may contain specific themes and terminology.
+
+1. Translate the original {src_language} subtitles into {TARGET_LANGUAGE} line by line
+2. Ensure the translation is faithful to the original, accurately conveying the original meaning
+3. Consider the context and professional terminology
+
+<translation_principles>
+1. Faithful to the original: Accurately convey the content and meaning of the original text, without arbitrarily changing, adding, or omitting content.
+2. Accurate terminology: Use professional terms correctly and maintain consistency in terminology.
+3. Understand the context: Fully comprehend and reflect the background and contextual relationships of the text.
+</translation_principles>
+
+### Content Summary
+{summary_prompt}
+
+### Glossary
+{glossary_prompt}
+'''.strip()
+
+def get_prefix_expressiveness(summary_prompt, glossary_prompt):
+    TARGET_LANGUAGE = load_key("target_language")
+    src_language = load_key("whisper.detected_language")
+    return f'''
+## Role
+You are a professional Netflix subtitle translator and language consultant.
+Your expertise lies not only in accurately understanding the original {src_language} but also in optimizing the {TARGET_LANGUAGE} translation to better suit the target language's expression habits and cultural background.
+
+## Task
+We already have a direct translation version of the original {src_language} subtitles.
+Your task is to reflect on and improve these direct translations to create more natural and fluent {TARGET_LANGUAGE} subtitles.
+
+1. Analyze the direct translation results line by line, pointing out existing issues
+2. Provide detailed modification suggestions
+3. Perform free translation based on your analysis
+4. Do not add comments or explanations in the translation, as the subtitles are for the audience to read
+5. Do not leave empty lines in the free translation, as the subtitles are for the audience to read
+
+<Translation Analysis Steps>
+Please use a two-step thinking process to handle the text line by line:
+
+1. Direct Translation Reflection:
+   - Evaluate language fluency
+   - Check if the language style is consistent with the original text
+   - Check the conciseness of the subtitles, point out where the translation is too wordy
+
+2. {TARGET_LANGUAGE} Free Translation:
+   - Aim for contextual smoothness and naturalness, conforming to {TARGET_LANGUAGE} expression habits
+   - Ensure it's easy for {TARGET_LANGUAGE} audience to understand and accept
+   - Adapt the language style to match the theme (e.g., use casual language for tutorials, professional terminology for technical content, formal language for documentaries)
+</Translation Analysis Steps>
+
+### Content Summary
+{summary_prompt}
+
+### Glossary
+{glossary_prompt}
+'''.strip()
+
+def get_chunk_prompt(prefix, lines, previous_content_prompt, after_content_prompt, things_to_note_prompt, json_format):
+    """The shared prefix followed by everything that changes from chunk to chunk"""
+    return f'''{prefix}
+
+### Context Information
+<previous_content>
+{previous_content_prompt}
+</previous_content>
+
+<subsequent_content>
+{after_content_prompt}
+</subsequent_content>
+
+### Glossary Terms in These Lines
+{things_to_note_prompt}
+
+## INPUT
+<subtitles>
+{lines}
+</subtitles>
+
+## Output in only JSON format and no other text
+```json
+{json_format}
+```
+
+Note: Start you answer with ```json and end with ```, do not add any other text.'''
+
 
 ## ================================================================
 # @ step6_splitforsub.py
@@ -297,6 +474,60 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 '''.strip()
     return align_prompt
 
+def get_align_batch_prompt(items):
+    """items: {id: (src_sub, tr_sub, src_part)}, answered as {id: {"align": [...]}}"""
+    targ_lang = load_key("target_language")
+    src_lang = load_key("whisper.detected_language")
+    subtitles = []
+    for key, (src_sub, tr_sub, src_part) in items.items():
+        src_splits = src_part.split('\n')
+        subtitles.append(f'''<subtitle id="{key}" parts="{len(src_splits)}">
+{src_lang} Original: "{src_sub}"
+{targ_lang} Original: "{tr_sub}"
+Pre-processed {src_lang} Subtitles ([br] indicates split points): {' [br] '.join(src_splits)}
+</subtitle>''')
+    subtitles = '\n'.join(subtitles)
+    first_key = next(iter(items))
+
+    align_batch_prompt = f'''
+## Role
+You are a Netflix subtitle alignment expert fluent in both {src_lang} and {targ_lang}.
+
+## Task
+We have several {src_lang} and {targ_lang} original subtitles for a Netflix program, each with a pre-processed split version of the {src_lang} subtitle.
+For each subtitle, create the best splitting scheme for the {targ_lang} subtitle based on this information.
+
+1. Analyze the word order and structural correspondence between {src_lang} and {targ_lang} subtitles
+2. Split the {targ_lang} subtitle into exactly as many parts as its pre-processed {src_lang} split version
+3. Never leave empty lines. If it's difficult to split based on meaning, you may appropriately rewrite the sentences that need to be aligned
+4. Do not add comments or explanations in the translation, as the subtitles are for the audience to read
+5. Handle every subtitle independently and answer for every id
+
+## INPUT
+<subtitles>
+{subtitles}
+</subtitles>
+
+## Output in only JSON format and no other text
+```json
+{{
+    "{first_key}": {{
+        "align": [
+            {{
+                "src_part_1": "First pre-processed {src_lang} part",
+                "target_part_1": "Corresponding aligned {targ_lang} subtitle part"
+            }},
+            ...one entry per part
+        ]
+    }},
+    ...one entry per subtitle id
+}}
+```
+
+Note: Start you answer with ```json and end with ```, do not add any other text.
+'''.strip()
+    return align_batch_prompt
+
 ## ================================================================
 # @ step8_gen_audio_task.py @ step10_gen_audio.py
 def get_subtitle_trim_prompt(text, duration):
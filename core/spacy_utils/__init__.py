@@ -3,11 +3,13 @@ from .split_by_connector import split_sentences_main
 from .split_by_mark import split_by_mark
 from .split_long_by_root import split_long_by_root_main
 from .load_nlp_model import init_nlp
+from .split_stream import StreamingSplitter
 
 __all__ = [
     "split_by_comma_main",
     "split_sentences_main",
     "split_by_mark",
     "split_long_by_root_main",
-    "init_nlp"
+    "init_nlp",
+    "StreamingSplitter"
 ]
@@ -7,35 +7,27 @@ from rich import print as rprint
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-def split_by_mark(nlp):
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
-    joiner = get_joiner(language)
-    rprint(f"[blue]🔍 Using {language} language joiner: '{joiner}'[/blue]")
-    chunks = pd.read_excel("output/log/cleaned_chunks.xlsx")
-    chunks.text = chunks.text.apply(lambda x: x.strip('"').strip(""))
-    
-    # join with joiner
-    input_text = joiner.join(chunks.text.to_list())
+# lines that are only one of these marks belong to the line before them
+MARK_ONLY = [',', '.', '，', '。', '？', '！']
 
-    doc = nlp(input_text)
-    assert doc.has_annotation("SENT_START")
+def continues_mark(previous, text):
+    """Whether `text` goes on from the sentence before it, cut at - or ..."""
+    return (
+        text.startswith('-') or 
+        text.startswith('...') or
+        previous.endswith('-') or
+        previous.endswith('...')
+    )
 
-    # skip - and ...
+def group_by_mark(sentences):
+    """Keep sentences cut at - or ... together with their continuation"""
     sentences_by_mark = []
     current_sentence = []
     
     # iterate all sentences
-    for sent in doc.sents:
-        text = sent.text.strip()
-        
+    for text in sentences:
         # check if the current sentence ends with - or ...
-        if current_sentence and (
-            text.startswith('-') or 
-            text.startswith('...') or
-            current_sentence[-1].endswith('-') or
-            current_sentence[-1].endswith('...')
-        ):
+        if current_sentence and continues_mark(current_sentence[-1], text):
             current_sentence.append(text)
         else:
             if current_sentence:
@@ -46,10 +38,28 @@ def split_by_mark(nlp):
     # add the last sentence
     if current_sentence:
         sentences_by_mark.append(' '.join(current_sentence))
+    return sentences_by_mark
+
+def split_by_mark(nlp):
+    whisper_language = load_key("whisper.language")
+    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
+    joiner = get_joiner(language)
+    rprint(f"[blue]🔍 Using {language} language joiner: '{joiner}'[/blue]")
+    chunks = pd.read_excel("output/log/cleaned_chunks.xlsx")
+    chunks.text = chunks.text.apply(lambda x: x.strip('"').strip(""))
+    
+    # join with joiner
+    input_text = joiner.join(chunks.text.to_list())
+
+    doc = nlp(input_text)
+    assert doc.has_annotation("SENT_START")
+
+    # skip - and ...
+    sentences_by_mark = group_by_mark([sent.text.strip() for sent in doc.sents])
 
     with open(SPLIT_BY_MARK_FILE, "w", encoding="utf-8") as output_file:
         for i, sentence in enumerate(sentences_by_mark):
-            if i > 0 and sentence.strip() in [',', '.', '，', '。', '？', '！']:
+            if i > 0 and sentence.strip() in MARK_ONLY:
                 # ! If the current line contains only punctuation, merge it with the previous line, this happens in Chinese, Japanese, etc.
                 output_file.seek(output_file.tell() - 1, os.SEEK_SET)  # Move to the end of the previous line
                 output_file.write(sentence)  # Add the punctuation
@@ -61,28 +61,32 @@ def split_extremely_long_sentence(doc):
     return sentences
 
 
+def split_long_by_root(sentence, nlp):
+    doc = nlp(sentence.strip())
+    if len(doc) <= 60:
+        return [sentence.strip()]
+    split_sentences = split_long_sentence(doc)
+    if any(len(nlp(sent)) > 60 for sent in split_sentences):
+        split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(nlp(sent))]
+    rprint(f"[yellow]✂️  Splitting long sentences by root: {sentence[:30]}...[/yellow]")
+    return split_sentences
+
+def is_punctuation_only(sentence):
+    punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+    stripped_sentence = sentence.strip()
+    return not stripped_sentence or all(char in punctuation for char in stripped_sentence)
+
 def split_long_by_root_main(nlp):
     with open(SPLIT_BY_CONNECTOR_FILE, "r", encoding="utf-8") as input_file:
         sentences = input_file.readlines()
 
     all_split_sentences = []
     for sentence in sentences:
-        doc = nlp(sentence.strip())
-        if len(doc) > 60:
-            split_sentences = split_long_sentence(doc)
-            if any(len(nlp(sent)) > 60 for sent in split_sentences):
-                split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(nlp(sent))]
-            all_split_sentences.extend(split_sentences)
-            rprint(f"[yellow]✂️  Splitting long sentences by root: {sentence[:30]}...[/yellow]")
-        else:
-            all_split_sentences.append(sentence.strip())
-
-    punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+        all_split_sentences.extend(split_long_by_root(sentence, nlp))
 
     with open(_3_1_SPLIT_BY_NLP, "w", encoding="utf-8") as output_file:
         for i, sentence in enumerate(all_split_sentences):
-            stripped_sentence = sentence.strip()
-            if not stripped_sentence or all(char in punctuation for char in stripped_sentence):
+            if is_punctuation_only(sentence):
                 rprint(f"[yellow]⚠️  Warning: Empty or punctuation-only line detected at index {i}[/yellow]")
                 if i > 0:
                     all_split_sentences[i-1] += sentence
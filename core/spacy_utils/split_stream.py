@@ -0,0 +1,73 @@
+import warnings
+from core.spacy_utils.split_by_mark import continues_mark, group_by_mark, MARK_ONLY
+from core.spacy_utils.split_by_comma import split_by_comma
+from core.spacy_utils.split_by_connector import split_by_connectors
+from core.spacy_utils.split_long_by_root import split_long_by_root, is_punctuation_only
+from core.utils.config_utils import load_key, get_joiner
+from rich import print as rprint
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+# ------------
+# split_by_spacy on text that arrives segment by segment (see stream_pipeline):
+# the last sentence seen so far may go on in the next segment, so it is held back and parsed again with the new words,
+# every sentence before it goes through the mark, comma, connector and root splits right away
+# ------------
+
+class StreamingSplitter:
+    def __init__(self, nlp):
+        self.nlp = nlp
+        whisper_language = load_key("whisper.language")
+        language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
+        self.joiner = get_joiner(language)
+        self.pending = ""
+        self.lines = 0
+
+    def feed(self, words):
+        """Add the words of the next segment, return the lines of the sentences that are complete"""
+        words = [word for word in words if word]
+        if not words:
+            return []
+        text = self.joiner.join(([self.pending] if self.pending else []) + words)
+        sents = list(self.nlp(text).sents)
+        texts = [sent.text.strip() for sent in sents]
+
+        # the last group (a sentence and its - / ... continuations) stays open, with a mark-only group also the one before it
+        start = len(sents) - 1
+        while start > 0 and continues_mark(texts[start - 1], texts[start]):
+            start -= 1
+        if start > 0 and ''.join(texts[start:]).strip() in MARK_ONLY:
+            start -= 1
+            while start > 0 and continues_mark(texts[start - 1], texts[start]):
+                start -= 1
+        self.pending = text[sents[start].start_char:] if sents else ""
+        return self._split(group_by_mark(texts[:start]))
+
+    def finish(self):
+        """The input ended: split what is still held back"""
+        text, self.pending = self.pending, ""
+        if not text:
+            return []
+        return self._split(group_by_mark([sent.text.strip() for sent in self.nlp(text).sents]))
+
+    def _split(self, sentences):
+        lines = []
+        for sentence in sentences:
+            if (lines or self.lines) and sentence.strip() in MARK_ONLY:
+                # ! a mark-only line belongs to the line before it, this happens in Chinese, Japanese, etc.
+                if lines:
+                    lines[-1] += sentence
+                continue
+            lines.append(sentence)
+
+        split_lines = []
+        for line in lines:
+            for part in split_by_comma(line.strip(), self.nlp):
+                for sentence in split_by_connectors(part.strip(), nlp=self.nlp):
+                    for split_sentence in split_long_by_root(sentence, self.nlp):
+                        if is_punctuation_only(split_sentence):
+                            rprint(f"[yellow]⚠️  Warning: Empty or punctuation-only line dropped after line {self.lines + len(split_lines)}[/yellow]")
+                            continue
+                        split_lines.append(split_sentence)
+        self.lines += len(split_lines)
+        return split_lines
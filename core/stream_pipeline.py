@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import queue
+import itertools
+import threading
+from rich.console import Console
+from rich.table import Table
+from core import _2_asr, _3_1_split_nlp, _3_2_split_meaning, _4_1_summarize, _4_2_translate
+from core.asr_backend.audio_preprocess import process_transcription
+from core.spacy_utils import init_nlp, StreamingSplitter
+from core.prompts import get_glossary_prompt
+from core.utils import *
+from core.utils.models import *
+from core.utils.ask_gpt import report_llm_stats
+from core.utils.llm_engine import submit, estimate_tokens
+console = Console()
+
+# ------------
+# streaming mode of steps 2 - 4.2: each transcribed segment's words go through the sentence splits as soon as the segment is done,
+# the summary runs once summary_length characters are split, and a translation chunk is sent as soon as the chunk after it
+# (its context) is packed. The usual files are written at the end, so steps 5+ do not change.
+# ------------
+
+_END = object()
+
+def _drain(results, state):
+    """Segment results in order until ASR is over"""
+    while True:
+        item = results.get()
+        if item is _END:
+            if state["aborted"]:
+                raise RuntimeError("Transcription failed, streaming stopped")
+            return
+        yield item
+
+def _segment_words(segments):
+    """Word texts of each segment, cleaned like save_results + split_by_mark do with the cleaned chunks file"""
+    for result in segments:
+        df = process_transcription(result)
+        yield [text.strip('"').strip() for text in df['text']] if len(df) else []
+
+def _nlp_lines(segments, nlp, nlp_lines):
+    splitter = StreamingSplitter(nlp)
+    for words in _segment_words(segments):
+        lines = splitter.feed(words)
+        nlp_lines.extend(lines)
+        yield lines
+    lines = splitter.finish()
+    nlp_lines.extend(lines)
+    yield lines
+
+def _meaning_lines(line_batches, nlp, meaning_lines):
+    max_length = load_key("max_split_length")
+    for lines in line_batches:
+        # 🔄 the same three passes as split_sentences_by_meaning, on the lines of this segment
+        for retry_attempt in range(3):
+            lines = _3_2_split_meaning.parallel_split_sentences(lines, max_length=max_length, nlp=nlp, retry_attempt=retry_attempt)
+        meaning_lines.extend(lines)
+        yield from lines
+
+def _stream_text(results, state):
+    """Runs on its own thread while ASR goes on, fills `state` with the lines, chunks and pending translations"""
+    start = state["start"]
+    segments = _drain(results, state)
+    first = next(segments, None)
+    if first is None:
+        return
+    # the language is known once a segment is transcribed
+    nlp = init_nlp()
+    lines = _meaning_lines(_nlp_lines(itertools.chain([first], segments), nlp, state["nlp_lines"]), nlp, state["meaning_lines"])
+
+    # 📝 the summary only reads the first summary_length characters, they are there long before the end
+    summary_length = load_key('summary_length')
+    head, chars = [], 0
+    for line in lines:
+        if not head:
+            state["timings"]["first line split"] = time.time() - start
+        head.append(line)
+        chars += len(line.strip()) + 1
+        if chars >= summary_length:
+            break
+    if not head:
+        return
+    _4_1_summarize.get_summary(' '.join(line.strip() for line in head)[:summary_length])
+    state["timings"]["summary"] = time.time() - start
+
+    with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
+        terminology = json.load(file)
+    theme_prompt = terminology.get('theme')
+    terms = terminology.get('terms', [])
+    glossary_prompt = get_glossary_prompt(terms)
+    chunk_set = load_key('translate_chunk')
+    line_average = sum(estimate_tokens(line) for line in head) / len(head)
+
+    chunks, futures = state["chunks"], state["futures"]
+    def translate(i):
+        future = submit(_4_2_translate.translate_chunk(chunks[i], chunks, theme_prompt, i, glossary_prompt))
+        future.add_done_callback(lambda f: state["translated_at"].append(time.time() - start))
+        if i == 0:
+            future.add_done_callback(lambda f: state["timings"].setdefault("first chunk translated", time.time() - start))
+        futures.append(future)
+
+    # 🔄 chunk N is translated once chunk N+1 is packed, so its previous and next lines are final
+    for chunk in _4_2_translate.pack_chunks(itertools.chain(head, lines), theme_prompt, terms, chunk_set['token_budget'], chunk_set['max_lines'], line_average):
+        chunks.append(chunk)
+        if len(chunks) > 1:
+            translate(len(chunks) - 2)
+    if chunks:
+        translate(len(chunks) - 1)
+    state["timings"]["text done"] = time.time() - start
+
+def _barrier_steps():
+    _2_asr.transcribe()
+    _3_1_split_nlp.split_by_spacy()
+    _3_2_split_meaning.split_sentences_by_meaning()
+    _4_1_summarize.get_summary()
+    _4_2_translate.translate_all()
+
+@check_file_exists(_4_2_TRANSLATION)
+def transcribe_and_translate():
+    """Steps 2 to 4.2 overlapped: translation of the first chunks starts while later segments are still transcribed"""
+    if any(os.path.exists(path) for path in (_2_CLEANED_CHUNKS, _3_1_SPLIT_BY_NLP, _3_2_SPLIT_BY_MEANING, _4_1_TERMINOLOGY)):
+        # a previous run got part of the way, the steps pick up from their own files
+        console.print("[yellow]⚠️ Intermediate files found, resuming step by step instead of streaming[/yellow]")
+        return _barrier_steps()
+
+    results = queue.Queue()
+    state = {"start": time.time(), "timings": {}, "nlp_lines": [], "meaning_lines": [], "chunks": [], "futures": [], "translated_at": [], "errors": [], "aborted": False}
+
+    @bind_job_config
+    def text_worker():
+        try:
+            _stream_text(results, state)
+        except Exception as e:
+            state["errors"].append(e)
+
+    def on_segment(index, result):
+        if state["errors"]:
+            # stop transcribing, nothing would use the rest
+            raise state["errors"][0]
+        results.put(result)
+        state["timings"].setdefault("first segment transcribed", time.time() - state["start"])
+
+    worker = threading.Thread(target=text_worker, name="stream-text", daemon=True)
+    worker.start()
+    try:
+        _2_asr.transcribe(on_segment=on_segment)
+        state["timings"]["transcribed"] = time.time() - state["start"]
+    except Exception:
+        state["aborted"] = True
+        raise
+    finally:
+        results.put(_END)
+        worker.join()
+        if state["aborted"] and os.path.exists(_4_1_TERMINOLOGY):
+            # summary of a partial transcript, a retry streams again from the start
+            os.remove(_4_1_TERMINOLOGY)
+    if state["errors"]:
+        raise state["errors"][0]
+
+    # 💾 the files the barrier steps would have written
+    with open(_3_1_SPLIT_BY_NLP, 'w', encoding='utf-8') as f:
+        f.write(''.join(line + '\n' for line in state["nlp_lines"]))
+    with open(_3_2_SPLIT_BY_MEANING, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(state["meaning_lines"]))
+    report_llm_stats(['split_by_meaning'])
+    translations = [future.result() for future in state["futures"]]
+    state["timings"]["translated"] = time.time() - state["start"]
+    _4_2_translate.save_translation(state["chunks"], translations)
+
+    table = Table(title="⏱️ Streaming pipeline")
+    table.add_column("milestone")
+    table.add_column("after")
+    for milestone, seconds in state["timings"].items():
+        table.add_row(milestone, f"{seconds:.1f}s")
+    console.print(table)
+    overlapped = sum(1 for seconds in state["translated_at"] if seconds < state["timings"]["transcribed"])
+    console.print(f"[cyan]{len(state['meaning_lines'])} lines in {len(state['chunks'])} chunks, "
+                  f"{overlapped} of them translated before transcription finished at {state['timings']['transcribed']:.1f}s[/cyan]")
+
+if __name__ == '__main__':
+    transcribe_and_translate()
@@ -1,9 +1,13 @@
 from core.prompts import generate_shared_prompt, get_prompt_faithfulness, get_prompt_expressiveness
+from core.prompts import get_prefix_faithfulness, get_prefix_expressiveness, get_chunk_prompt, get_faithfulness_json_format, get_expressiveness_json_format
+from core.prompts import get_numbered_lines, get_numbered_direct_lines, get_compact_json_format
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
 from rich import box
 from core.utils import *
+from core.utils.llm_engine import run_sync
+from core.utils.ask_gpt import stream_expect_keys
 console = Console()
 
 def valid_translate_result(result: dict, required_keys: list, required_sub_keys: list):
@@ -11,36 +15,51 @@ def valid_translate_result(result: dict, required_keys: list, required_sub_keys:
     if not all(key in result for key in required_keys):
         return {"status": "error", "message": f"Missing required key(s): {', '.join(set(required_keys) - set(result.keys()))}"}
     
-    # Check for required sub-keys in all items
+    # Check for required sub-keys in all items, compact answers (no sub-keys) hold the translation itself
     for key in result:
+        if not required_sub_keys:
+            if not isinstance(result[key], str):
+                return {"status": "error", "message": f"Item {key} should be the translation string"}
+            continue
         if not all(sub_key in result[key] for sub_key in required_sub_keys):
             return {"status": "error", "message": f"Missing required sub-key(s) in item {key}: {', '.join(set(required_sub_keys) - set(result[key].keys()))}"}
 
     return {"status": "success", "message": "Translation completed"}
 
-def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
+async def translate_lines_async(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0, glossary_prompt = None):
     shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
+    # prefix_cache: video-wide instructions, theme and glossary first, identical for every chunk
+    prefix_layout = load_key('prompt_layout') == 'prefix_cache'
+    # compact: {"1": "translation"} answers, no echoed source lines
+    compact = load_key('translate_format') == 'compact'
+    length = len(lines.split('\n'))
 
     # Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
-    def retry_translation(prompt, length, step_name):
-        def valid_faith(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['direct'])
-        def valid_express(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['free'])
+    async def retry_translation(prompt, length, step_name):
+        required_keys = [str(i) for i in range(1, length+1)]
+        sub_keys = [] if compact else ['direct'] if step_name == 'faithfulness' else ['free']
+        def valid_result(response_data):
+            return valid_translate_result(response_data, required_keys, sub_keys)
         for retry in range(3):
-            if step_name == 'faithfulness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_faith, log_title=f'translate_{step_name}')
-            elif step_name == 'expressiveness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_express, log_title=f'translate_{step_name}')
+            result = await ask_gpt_async(prompt+retry* " ", resp_type='json', valid_def=valid_result, log_title=f'translate_{step_name}',
+                                         stream_check=stream_expect_keys(required_keys, sub_keys, ordered=True))
             if len(lines.split('\n')) == len(result):
                 return result
             if retry != 2:
                 console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
-        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
+        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.jsonl` for more details.[/red]')
 
     ## Step 1: Faithful to the Original Text
-    prompt1 = get_prompt_faithfulness(lines, shared_prompt)
-    faith_result = retry_translation(prompt1, len(lines.split('\n')), 'faithfulness')
+    faith_lines = get_numbered_lines(lines) if compact else lines
+    faith_format = get_compact_json_format(length, 'direct') if compact else get_faithfulness_json_format(lines)
+    if prefix_layout:
+        prompt1 = get_chunk_prompt(get_prefix_faithfulness(summary_prompt, glossary_prompt), faith_lines, previous_content_prompt, after_cotent_prompt,
+                                   things_to_note_prompt, faith_format)
+    else:
+        prompt1 = get_prompt_faithfulness(faith_lines, shared_prompt, faith_format)
+    faith_result = await retry_translation(prompt1, length, 'faithfulness')
+    if compact:
+        faith_result = {str(i): {"origin": origin, "direct": faith_result[str(i)]} for i, origin in enumerate(lines.split('\n'), 1)}
 
     for i in faith_result:
         faith_result[i]["direct"] = faith_result[i]["direct"].replace('\n', ' ')
@@ -63,8 +82,16 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
         return translate_result, lines
 
     ## Step 2: Express Smoothly  
-    prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
-    express_result = retry_translation(prompt2, len(lines.split('\n')), 'expressiveness')
+    express_lines = get_numbered_direct_lines(faith_result) if compact else lines
+    express_format = get_compact_json_format(length, 'free') if compact else get_expressiveness_json_format(faith_result)
+    if prefix_layout:
+        prompt2 = get_chunk_prompt(get_prefix_expressiveness(summary_prompt, glossary_prompt), express_lines, previous_content_prompt, after_cotent_prompt,
+                                   things_to_note_prompt, express_format)
+    else:
+        prompt2 = get_prompt_expressiveness(faith_result, express_lines, shared_prompt, express_format)
+    express_result = await retry_translation(prompt2, length, 'expressiveness')
+    if compact:
+        express_result = {key: {"free": free} for key, free in express_result.items()}
 
     table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
     table.add_column("Translations", style="bold")
@@ -80,11 +107,15 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
     translate_result = "\n".join([express_result[i]["free"].replace('\n', ' ').strip() for i in express_result])
 
     if len(lines.split('\n')) != len(translate_result.split('\n')):
-        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.json`[/red]'))
+        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.jsonl`[/red]'))
         raise ValueError(f'Origin ···{lines}···,\nbut got ···{translate_result}···')
 
     return translate_result, lines
 
+def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0, glossary_prompt = None):
+    return run_sync(translate_lines_async(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index,
+                                          glossary_prompt=glossary_prompt))
+
 
 if __name__ == '__main__':
     # test e.g.
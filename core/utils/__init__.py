@@ -1,10 +1,10 @@
 # use try-except to avoid error when installing
 try:
-    from .ask_gpt import ask_gpt
+    from .ask_gpt import ask_gpt, ask_gpt_async
     from .decorator import except_handler, check_file_exists
-    from .config_utils import load_key, update_key, get_joiner
+    from .config_utils import load_key, load_typed, update_key, set_job_key, job_config, bind_job_config, get_job_values, get_joiner
     from rich import print as rprint
 except ImportError:
     pass
 
-__all__ = ["ask_gpt", "except_handler", "check_file_exists", "load_key", "update_key", "rprint", "get_joiner"]
\ No newline at end of file
+__all__ = ["ask_gpt", "ask_gpt_async", "except_handler", "check_file_exists", "load_key", "load_typed", "update_key", "set_job_key", "job_config", "bind_job_config", "get_job_values", "rprint", "get_joiner"]
\ No newline at end of file
@@ -1,94 +1,417 @@
-import os
-import json
-from threading import Lock
+import copy
+import time
+import asyncio
+from collections import defaultdict, deque
 import json_repair
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from core.utils.config_utils import load_key
+from core.utils.gpt_cache import cache_key, lookup, store, append_audit_log
+from core.utils.llm_engine import run_sync, request_slot, estimate_tokens, get_concurrency_windows
+from core.utils.llm_telemetry import new_call, add_usage, record_call, report_telemetry, reset_telemetry
 from rich import print as rprint
+from rich.table import Table
 from core.utils.decorator import except_handler
 
 # ------------
 # cache gpt response
 # ------------
 
-LOCK = Lock()
-GPT_LOG_FOLDER = 'output/gpt_log'
-
-def _save_cache(model, prompt, resp_content, resp_type, resp, message=None, log_title="default"):
-    with LOCK:
-        logs = []
-        file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        if os.path.exists(file):
-            with open(file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        logs.append({"model": model, "prompt": prompt, "resp_content": resp_content, "resp_type": resp_type, "resp": resp, "message": message})
-        with open(file, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=4)
-
-def _load_cache(prompt, resp_type, log_title):
-    with LOCK:
-        file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-        if os.path.exists(file):
-            with open(file, 'r', encoding='utf-8') as f:
-                for item in json.load(f):
-                    if item["prompt"] == prompt and item["resp_type"] == resp_type:
-                        return item["resp"]
+def _save_cache(model, prompt, resp_content, resp_type, resp, message=None, log_title="default", key=None):
+    if key is not None:
+        store(key, resp, model, log_title)
+    append_audit_log(log_title, {"model": model, "prompt": prompt, "resp_content": resp_content, "resp_type": resp_type, "resp": resp, "message": message})
+
+def _load_cache(key, log_title):
+    """Returns (resp or False, cache outcome)"""
+    resp, outcome = lookup(key, log_title)
+    return resp or False, outcome
+
+def _get_base_url(base_url=None):
+    base_url = base_url or load_key("api.base_url")
+    if 'ark' in base_url:
+        return "https://ark.cn-beijing.volces.com/api/v3" # huoshan base url
+    elif 'v1' not in base_url:
+        return base_url.strip('/') + '/v1'
+    return base_url
+
+# ------------
+# pooled clients
+# ------------
+
+# only touched from the engine loop, so no lock is needed
+_CLIENTS = {}
+
+def _http2_supported():
+    try:
+        import h2  # noqa: F401  httpx needs it for HTTP/2
+        return True
+    except ImportError:
         return False
 
+def get_client(base_url, api_key):
+    """One async OpenAI client per (base_url, api_key), sharing a keep-alive connection pool"""
+    key = (base_url, api_key)
+    if key not in _CLIENTS:
+        pool = load_key("llm_pool")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool["max_connections"], max_keepalive_connections=pool["max_keepalive"]),
+            http2=pool["http2"] and _http2_supported(),
+            timeout=300,
+        )
+        # retries are left to ask_gpt_async so that 429s reach the adaptive limiter
+        _CLIENTS[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    return _CLIENTS[key]
+
 # ------------
-# ask gpt once
+# per-step model routing: llm_routes.<log_title> picks the model / endpoint / timeout of that step
 # ------------
 
-@except_handler("GPT request failed", retry=5)
-def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
-    if not load_key("api.key"):
-        raise ValueError("API key is not set")
-    # check cache
-    cached = _load_cache(prompt, resp_type, log_title)
-    if cached:
-        rprint("use cache response")
-        return cached
+def _main_endpoint():
+    return {"model": load_key("api.model"), "base_url": _get_base_url(), "api_key": load_key("api.key"), "timeout": 300}
 
-    model = load_key("api.model")
-    base_url = load_key("api.base_url")
-    if 'ark' in base_url:
-        base_url = "https://ark.cn-beijing.volces.com/api/v3" # huoshan base url
-    elif 'v1' not in base_url:
-        base_url = base_url.strip('/') + '/v1'
-    client = OpenAI(api_key=load_key("api.key"), base_url=base_url)
+def _get_route(log_title):
+    routes = load_key("llm_routes") or {}
+    # batched requests (<log_title>_batch) follow the route of their step
+    if log_title not in routes and log_title.endswith("_batch"):
+        log_title = log_title[:-len("_batch")]
+    return routes.get(log_title)
+
+def _route_endpoint(log_title, call=None):
+    """The endpoint of the step, the main one once the call fell back after a failed validation"""
+    endpoint = _main_endpoint()
+    route = _get_route(log_title)
+    if not route or (call is not None and call["fallback"]):
+        return endpoint
+    return {"model": route.get("model") or endpoint["model"],
+            "base_url": _get_base_url(route["base_url"]) if route.get("base_url") else endpoint["base_url"],
+            "api_key": route.get("key") or endpoint["api_key"],
+            "timeout": route.get("timeout") or endpoint["timeout"]}
+
+# ------------
+# hedged requests: duplicate a request that runs past the latency percentile of its log_title
+# ------------
+
+_LATENCIES = defaultdict(lambda: deque(maxlen=200))
+_HEDGE_STATS = defaultdict(lambda: {"requests": 0, "hedged": 0, "hedge_wins": 0, "extra_prompt_tokens": 0})
+
+def _hedge_threshold(log_title):
+    hedge = load_key("llm_hedge")
+    latencies = _LATENCIES[log_title]
+    if not hedge["enabled"] or len(latencies) < hedge["min_samples"]:
+        return None
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * hedge["percentile"] / 100))]
+
+def _hedge_endpoint(primary):
+    hedge = load_key("llm_hedge")
+    if not hedge["base_url"]:
+        return primary
+    return {"model": hedge["model"] or primary["model"], "base_url": _get_base_url(hedge["base_url"]), "api_key": hedge["key"] or primary["api_key"],
+            "timeout": primary["timeout"]}
+
+def get_hedge_stats():
+    return {title: dict(stats) for title, stats in _HEDGE_STATS.items()}
+
+# ------------
+# streaming: parse the partial JSON as it arrives and abort once it can no longer pass validation
+# ------------
+
+_STREAM_STATS = defaultdict(lambda: {"streams": 0, "aborts": 0, "ttft": deque(maxlen=200), "time_saved": 0.0})
+_RESPONSE_LENGTHS = defaultdict(lambda: deque(maxlen=50))
+
+def stream_expect_keys(required_keys, sub_keys=(), allowed_keys=(), ordered=False):
+    """Build a stream_check for a JSON object answer: completed keys must be in required_keys (or allowed_keys),
+    in the order of required_keys if ordered, and each completed item must contain sub_keys"""
+    expected = set(required_keys) | set(allowed_keys)
+    def check(partial):
+        if not isinstance(partial, dict):
+            return {"status": "success", "message": "Waiting for more"}
+        # the last key may still be streaming, e.g. "1" could turn into "12"
+        completed = list(partial)[:-1]
+        unexpected = [k for k in completed if k not in expected]
+        if unexpected:
+            return {"status": "error", "message": f"Unexpected key(s): {', '.join(unexpected)}"}
+        if ordered:
+            seen = [k for k in completed if k in required_keys]
+            if seen != list(required_keys)[:len(seen)]:
+                return {"status": "error", "message": f"Keys out of order: {', '.join(seen)}"}
+        for k in completed:
+            missing = [sub for sub in sub_keys if not isinstance(partial[k], dict) or sub not in partial[k]]
+            if missing:
+                return {"status": "error", "message": f"Missing required sub-key(s) in item {k}: {', '.join(missing)}"}
+        return {"status": "success", "message": "Streaming"}
+    return check
+
+def _check_partial(content, resp_type, stream_check):
+    if resp_type == "json":
+        # a top-level array can never become the expected JSON object
+        start = min((i for i in (content.find('{'), content.find('[')) if i != -1), default=-1)
+        if start != -1 and content[start] == '[':
+            return {"status": "error", "message": "Response is a JSON array, expected an object"}
+        return stream_check(json_repair.loads(content))
+    return stream_check(content)
+
+def _estimate_time_saved(log_title, received, elapsed):
+    """Time the aborted response would still have needed, from the median length of earlier answers"""
+    lengths = _RESPONSE_LENGTHS[log_title]
+    if not lengths or not received or elapsed <= 0:
+        return 0.0
+    remaining = sorted(lengths)[len(lengths) // 2] - received
+    return max(0.0, remaining / (received / elapsed))
+
+def get_stream_stats():
+    return {title: {**stats, "ttft": list(stats["ttft"])} for title, stats in _STREAM_STATS.items()}
+
+async def _stream_content(client, params, prompt, resp_type, stream_check, log_title, model):
+    """Stream the completion, running stream_check every llm_stream.check_chars new characters.
+    Returns (content, usage), usage comes with the last chunk"""
+    stats = _STREAM_STATS[log_title]
+    stats["streams"] += 1
+    check_chars = load_key("llm_stream.check_chars")
+    stream = await client.chat.completions.create(**params, stream=True, stream_options={"include_usage": True})
+    start, first_token, content, checked, usage = time.monotonic(), None, "", 0, None
+    try:
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if first_token is None:
+                first_token = time.monotonic()
+                stats["ttft"].append(first_token - start)
+            content += chunk.choices[0].delta.content
+            if len(content) - checked < check_chars:
+                continue
+            checked = len(content)
+            valid = _check_partial(content, resp_type, stream_check)
+            if valid["status"] != "success":
+                stats["aborts"] += 1
+                stats["time_saved"] += _estimate_time_saved(log_title, len(content), time.monotonic() - first_token)
+                await asyncio.to_thread(_save_cache, model, prompt, content, resp_type, None, log_title="error", message=f"aborted while streaming: {valid['message']}")
+                raise ValueError(f"❎ API response aborted while streaming: {valid['message']}")
+    finally:
+        await stream.close()
+    _RESPONSE_LENGTHS[log_title].append(len(content))
+    return content, usage
+
+# ------------
+# ask gpt once
+# ------------
+
+async def _request(endpoint, prompt, resp_type, valid_def, stream_check=None, log_title="default", started=None, call=None):
+    """Send one request and return (resp, resp_content), raising if the response is invalid.
+    started is set once the request got its concurrency slot, the latency of log_title is measured from there.
+    Queue wait, latency, token usage and validation failures go to the telemetry record call"""
+    call = call if call is not None else new_call(log_title, endpoint["model"])
+    client = get_client(endpoint["base_url"], endpoint["api_key"])
     response_format = {"type": "json_object"} if resp_type == "json" and load_key("api.llm_support_json") else None
 
     messages = [{"role": "user", "content": prompt}]
 
     params = dict(
-        model=model,
+        model=endpoint["model"],
         messages=messages,
         response_format=response_format,
-        timeout=300
+        timeout=endpoint["timeout"]
     )
-    resp_raw = client.chat.completions.create(**params)
+    queued = time.monotonic()
+    async with request_slot(endpoint["base_url"], prompt):
+        sent = time.monotonic()
+        call["queue_wait"] += sent - queued
+        if started is not None:
+            started.set()
+        try:
+            if stream_check is not None and load_key("llm_stream.enabled"):
+                resp_content, usage = await _stream_content(client, params, prompt, resp_type, stream_check, log_title, endpoint["model"])
+            else:
+                resp_raw = await client.chat.completions.create(**params)
+                resp_content, usage = resp_raw.choices[0].message.content, resp_raw.usage
+        except ValueError:
+            call["validation_failures"] += 1  # aborted while streaming
+            raise
+    add_usage(call, usage)
 
     # process and return full result
-    resp_content = resp_raw.choices[0].message.content
     if resp_type == "json":
         resp = json_repair.loads(resp_content)
     else:
         resp = resp_content
-    
+
     # check if the response format is valid
     if valid_def:
         valid_resp = valid_def(resp)
         if valid_resp['status'] != 'success':
-            _save_cache(model, prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'])
+            call["validation_failures"] += 1
+            await asyncio.to_thread(_save_cache, endpoint["model"], prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'])
             raise ValueError(f"❎ API response error: {valid_resp['message']}")
+    call["latency"] = time.monotonic() - sent
+    _LATENCIES[log_title].append(call["latency"])
+    return resp, resp_content
+
+async def _hedged_request(endpoint, prompt, resp_type, valid_def, stream_check, log_title, call):
+    """The first valid response wins, the other request is cancelled"""
+    stats = _HEDGE_STATS[log_title]
+    stats["requests"] += 1
+    threshold = _hedge_threshold(log_title)
+    started = asyncio.Event()
+    primary = asyncio.create_task(_request(endpoint, prompt, resp_type, valid_def, stream_check, log_title, started, call))
+    if threshold is None:
+        return await primary
+    # time spent waiting for a concurrency slot does not count, a duplicate would wait just the same
+    waiter = asyncio.create_task(started.wait())
+    await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+    done, _ = await asyncio.wait({primary}, timeout=threshold)
+    if done:
+        return primary.result()
+
+    stats["hedged"] += 1
+    stats["extra_prompt_tokens"] += estimate_tokens(prompt)
+    call["hedged"] = True
+    hedge = asyncio.create_task(_request(_hedge_endpoint(endpoint), prompt, resp_type, valid_def, stream_check, log_title, call=call))
+    pending, error = {primary, hedge}, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        stats["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+@except_handler("GPT request failed", retry=5)
+async def _ask_gpt_with_retry(prompt, resp_type, valid_def, log_title, stream_check, call):
+    call["attempts"] += 1
+    if not load_key("api.key"):
+        raise ValueError("API key is not set")
+    endpoint = _route_endpoint(log_title, call)
+    call["model"] = endpoint["model"]
+    call["routed"] = endpoint["model"] != load_key("api.model") or endpoint["base_url"] != _get_base_url()
+
+    # check cache
+    key = cache_key(endpoint["model"], endpoint["base_url"], prompt, resp_type)
+    cached, call["cache"] = await asyncio.to_thread(_load_cache, key, log_title)
+    if cached:
+        rprint("use cache response")
+        return cached
 
-    _save_cache(model, prompt, resp_content, resp_type, resp, log_title=log_title)
+    try:
+        resp, resp_content = await _hedged_request(endpoint, prompt, resp_type, valid_def, stream_check, log_title, call)
+    except ValueError:
+        # an answer that failed validation: the next attempt goes to the main model if the route allows it
+        if call["routed"] and (_get_route(log_title) or {}).get("fallback"):
+            call["fallback"] = True
+            rprint(f"[yellow]↩️ {log_title}: {endpoint['model']} answer failed validation, falling back to {load_key('api.model')}[/yellow]")
+        raise
+    await asyncio.to_thread(_save_cache, endpoint["model"], prompt, resp_content, resp_type, resp, log_title=log_title, key=key)
     return resp
 
+# ------------
+# single-flight: concurrent calls with the same cache key share one request (repeated lyrics, intros, identical trims)
+# ------------
+
+_IN_FLIGHT = {}  # cache key -> future of the leading call, only touched on the engine loop
+
+async def ask_gpt_async(prompt, resp_type=None, valid_def=None, log_title="default", stream_check=None):
+    """stream_check(partial) is run on the partially parsed response when llm_stream.enabled is set,
+    an error status aborts the request early so it can be retried"""
+    call = new_call(log_title, None)
+    start = time.monotonic()
+    endpoint = _route_endpoint(log_title)
+    key = cache_key(endpoint["model"], endpoint["base_url"], prompt, resp_type)
+    try:
+        while key in _IN_FLIGHT:
+            leader = _IN_FLIGHT[key]
+            try:
+                resp = await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                continue  # the leading call was cancelled, take its place
+            call["cache"], call["model"], call["ok"] = "inflight_hit", endpoint["model"], True
+            # callers may edit their response in place
+            return copy.deepcopy(resp)
+
+        future = asyncio.get_running_loop().create_future()
+        _IN_FLIGHT[key] = future
+        try:
+            resp = await _ask_gpt_with_retry(prompt, resp_type, valid_def, log_title, stream_check, call)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # followers re-raise it, no "never retrieved" warning when there are none
+            raise
+        finally:
+            _IN_FLIGHT.pop(key, None)
+        future.set_result(resp)
+        call["ok"] = True
+        return resp
+    finally:
+        await asyncio.to_thread(record_call, call, time.monotonic() - start)
+
+def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default", stream_check=None):
+    """Blocking wrapper, the request itself runs on the shared LLM engine loop"""
+    return run_sync(ask_gpt_async(prompt, resp_type=resp_type, valid_def=valid_def, log_title=log_title, stream_check=stream_check))
+
+
+# ------------
+# stage report
+# ------------
+
+def _report_stream_stats(log_titles):
+    stats = get_stream_stats()
+    titles = [t for t in log_titles if stats.get(t, {}).get("streams")]
+    if not titles:
+        return
+    table = Table(title="📡 Streamed requests")
+    for column in ("log_title", "streams", "median TTFT", "early aborts", "est. time saved"):
+        table.add_column(column)
+    for title in titles:
+        counts = stats[title]
+        ttft = sorted(counts["ttft"])
+        median = f"{ttft[len(ttft) // 2]:.2f}s" if ttft else "-"
+        table.add_row(title, str(counts["streams"]), median, str(counts["aborts"]), f"{counts['time_saved']:.1f}s")
+    rprint(table)
+
+def reset_llm_stats():
+    """Start the telemetry, batching, streaming and hedging counters over for a new job.
+    Latency and answer length history is kept, it describes the endpoints rather than the job."""
+    from core.utils.llm_batch import reset_batch_stats
+    reset_telemetry()
+    reset_batch_stats()
+    _HEDGE_STATS.clear()
+    _STREAM_STATS.clear()
+
+def report_llm_stats(log_titles):
+    """Print telemetry, batching, streaming and hedging counters for the log_titles of a finished stage"""
+    from core.utils.llm_batch import report_batch_stats
+    report_telemetry(log_titles + [f"{t}_batch" for t in log_titles])
+    windows = get_concurrency_windows()
+    if windows:
+        rprint(f"[cyan]LLM concurrency windows: {', '.join(f'{name} -> {window}' for name, window in windows.items())}[/cyan]")
+    report_batch_stats(log_titles)
+    _report_stream_stats(log_titles)
+    stats = get_hedge_stats()
+    titles = [t for t in log_titles if stats.get(t, {}).get("hedged")]
+    if not titles:
+        return
+    table = Table(title="🏁 Hedged requests")
+    for column in ("log_title", "requests", "hedged", "hedge rate", "hedge wins", "extra prompt tokens"):
+        table.add_column(column)
+    for title in titles:
+        counts = stats[title]
+        table.add_row(title, str(counts["requests"]), str(counts["hedged"]), f"{counts['hedged'] / counts['requests']:.1%}", str(counts["hedge_wins"]), str(counts["extra_prompt_tokens"]))
+    rprint(table)
 
 if __name__ == '__main__':
     from rich import print as rprint
-    
+
     result = ask_gpt("""test respond ```json\n{\"code\": 200, \"message\": \"success\"}\n```""", resp_type="json")
     rprint(f"Test json output result: {result}")
@@ -1,5 +1,13 @@
-from ruamel.yaml import YAML
+import os
+import re
+import json
+import copy
+import functools
 import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from ruamel.yaml import YAML
+from core.utils.models import _JOB_CONFIG
 
 CONFIG_PATH = 'config.yaml'
 lock = threading.Lock()
@@ -8,27 +16,201 @@ yaml = YAML()
 yaml.preserve_quotes = True
 
 # -----------------------
-# load & update config
+# config snapshot
 # -----------------------
 
-def load_key(key):
+# (mtime_ns, size) of the parsed file and the parsed data, swapped atomically
+_snapshot = (None, None)
+
+def _file_signature():
+    stat = os.stat(CONFIG_PATH)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_config():
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
+        return yaml.load(file)
+
+def _get_config():
+    """Return the parsed config, re-parsing only when the file on disk has changed"""
+    global _snapshot
+    signature = _file_signature()
+    cached_signature, data = _snapshot
+    if signature == cached_signature:
+        return data
     with lock:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            data = yaml.load(file)
+        # another thread may have refreshed the snapshot while we waited
+        signature = _file_signature()
+        if _snapshot[0] != signature:
+            _snapshot = (signature, _read_config())
+        return _snapshot[1]
 
-    keys = key.split('.')
+def _walk(data, key):
     value = data
-    for k in keys:
+    for k in key.split('.'):
         if isinstance(value, dict) and k in value:
             value = value[k]
         else:
             raise KeyError(f"Key '{k}' not found in configuration")
     return value
 
+# -----------------------
+# per-job overlay
+# -----------------------
+
+# {'values': {dotted key: value}, 'manifest': path or None} of the job running in this context
+_job_overlay = ContextVar('job_overlay', default=None)
+# values of the default job manifest, used when no job context is active
+_manifest_snapshot = (None, {})
+
+def _read_manifest(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def _write_manifest(path, values):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(values, file, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+def _default_overlay():
+    global _manifest_snapshot
+    try:
+        stat = os.stat(_JOB_CONFIG)
+    except FileNotFoundError:
+        return {}
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if _manifest_snapshot[0] != signature:
+        _manifest_snapshot = (signature, _read_manifest(_JOB_CONFIG))
+    return _manifest_snapshot[1]
+
+def _current_overlay():
+    job = _job_overlay.get()
+    return job['values'] if job is not None else _default_overlay()
+
+def job_manifest(job_id=None):
+    """Manifest path of one job (e.g. a batch task's video), the default manifest without job_id"""
+    if not job_id:
+        return _JOB_CONFIG
+    name = re.sub(r'[^\w.-]+', '_', str(job_id))[:100]
+    return os.path.join(os.path.dirname(_JOB_CONFIG), f"job_config.{name}.json")
+
+@contextmanager
+def job_config(overrides=None, manifest=_JOB_CONFIG, resume=True):
+    """Scope config values to one job. load_key reads through them and config.yaml is never rewritten.
+    Values are written to the job manifest by set_job_key, pass manifest=None to keep them in memory only.
+    resume=True seeds them from the manifest (retrying the same job), a fresh job passes resume=False so a manifest left by another run is ignored."""
+    values = _read_manifest(manifest) if resume else {}
+    values.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    token = _job_overlay.set({'values': values, 'manifest': manifest})
+    try:
+        yield values
+    finally:
+        _job_overlay.reset(token)
+
+def set_job_key(key, new_value):
+    """Record a value for the current job only, e.g. the language detected by ASR"""
+    _walk(_get_config(), key)  # only known keys can be overlaid
+    job = _job_overlay.get()
+    with lock:
+        if job is None:
+            values = dict(_read_manifest(_JOB_CONFIG))
+            values[key] = new_value
+            _write_manifest(_JOB_CONFIG, values)
+            return
+        job['values'][key] = new_value
+        if job['manifest']:
+            _write_manifest(job['manifest'], job['values'])
+
+def _forget_job_key(key, new_value):
+    """update_key wrote key to config.yaml: the active overlay (the job's, else the default manifest) must not shadow it. Call with lock held"""
+    job = _job_overlay.get()
+    values = job['values'] if job is not None else dict(_read_manifest(_JOB_CONFIG))
+    changed = False
+    for k in list(values):
+        if k == key or k.startswith(key + '.'):
+            del values[k]
+            changed = True
+        elif key.startswith(k + '.') and isinstance(values[k], dict):
+            # a whole section is overlaid, set the value inside it
+            values[k] = copy.deepcopy(values[k])
+            parent, _, last = key[len(k) + 1:].rpartition('.')
+            try:
+                target = _walk(values[k], parent) if parent else values[k]
+            except KeyError:
+                continue
+            if not isinstance(target, dict):
+                continue
+            target[last] = new_value
+            changed = True
+    if not changed:
+        return
+    manifest = job['manifest'] if job is not None else _JOB_CONFIG
+    if manifest:
+        _write_manifest(manifest, values)
+
+def get_job_values():
+    """The current job's config values, e.g. to re-create the job in a worker process with job_config(values, manifest=None)"""
+    return dict(_current_overlay())
+
+def bind_job_config(func):
+    """Carry the caller's job overlay into functions run on other threads (e.g. executor.submit)"""
+    job = _job_overlay.get()
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _job_overlay.set(job)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _job_overlay.reset(token)
+    return wrapper
+
+# -----------------------
+# load & update config
+# -----------------------
+
+def load_key(key):
+    # ! the returned value is shared with the snapshot, treat dicts and lists as read-only
+    overlay = _current_overlay()
+    if overlay:
+        if key in overlay:
+            return overlay[key]
+        for k, v in overlay.items():
+            if key.startswith(k + '.'):
+                return _walk(v, key[len(k) + 1:])
+        prefix = key + '.'
+        nested = [(k[len(prefix):], v) for k, v in overlay.items() if k.startswith(prefix)]
+        if nested:
+            value = copy.deepcopy(_walk(_get_config(), key))
+            for sub_key, v in nested:
+                parent, _, last = sub_key.rpartition('.')
+                target = _walk(value, parent) if parent else value
+                target[last] = v
+            return value
+    return _walk(_get_config(), key)
+
+def load_typed(key, value_type):
+    """Load a key and make sure it has the expected type, e.g. load_typed('max_workers', int)"""
+    value = load_key(key)
+    try:
+        if value_type is bool:
+            if isinstance(value, bool):
+                return value
+        elif value_type in (int, float):
+            if not isinstance(value, bool):
+                return value_type(value)
+        elif isinstance(value, value_type):
+            return value
+    except (TypeError, ValueError):
+        pass
+    raise TypeError(f"Config key '{key}' should be {value_type.__name__}, got {type(value).__name__}: {value!r}")
+
 def update_key(key, new_value):
+    global _snapshot
     with lock:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            data = yaml.load(file)
+        data = _read_config()
 
         keys = key.split('.')
         current = data
@@ -42,10 +224,12 @@ def update_key(key, new_value):
             current[keys[-1]] = new_value
             with open(CONFIG_PATH, 'w', encoding='utf-8') as file:
                 yaml.dump(data, file)
+            _snapshot = (_file_signature(), data)
+            _forget_job_key(key, new_value)
             return True
         else:
             raise KeyError(f"Key '{keys[-1]}' not found in configuration")
-        
+
 # basic utils
 def get_joiner(language):
     if language in load_key('language_split_with_space'):
@@ -55,5 +239,29 @@ def get_joiner(language):
     else:
         raise ValueError(f"Unsupported language code: {language}")
 
+# -----------------------
+# benchmark
+# -----------------------
+
+def _load_key_from_disk(key):
+    """The previous read path: open and parse config.yaml under the lock on every call"""
+    with lock:
+        data = _read_config()
+    return _walk(data, key)
+
+def benchmark_load_key(key='subtitle.max_length', n=500):
+    import time
+    results = {}
+    for name, func in (("disk", _load_key_from_disk), ("snapshot", load_key)):
+        func(key)
+        start = time.perf_counter()
+        for _ in range(n):
+            func(key)
+        results[name] = (time.perf_counter() - start) / n * 1e6
+    return results
+
 if __name__ == "__main__":
     print(load_key('language_split_with_space'))
+    results = benchmark_load_key()
+    print(f"load_key from disk: {results['disk']:.1f} us/call, from snapshot: {results['snapshot']:.2f} us/call, "
+          f"speedup x{results['disk'] / results['snapshot']:.0f}")
@@ -1,4 +1,6 @@
 import functools
+import asyncio
+import inspect
 import time
 import os
 from rich import print as rprint
@@ -9,6 +11,21 @@ from rich import print as rprint
 
 def except_handler(error_msg, retry=0, delay=1, default_return=None):
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for i in range(retry + 1):
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        rprint(f"[red]{error_msg}: {e}, retry: {i+1}/{retry}[/red]")
+                        if i == retry:
+                            if default_return is not None:
+                                return default_return
+                            raise
+                        await asyncio.sleep(delay * (2**i))
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             last_exception = None
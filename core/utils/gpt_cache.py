@@ -0,0 +1,345 @@
+import os
+import json
+import time
+import sqlite3
+import hmac
+import hashlib
+import threading
+import requests
+from rich import print as rprint
+from core.utils.config_utils import load_key
+
+# ------------
+# gpt response cache: indexed sqlite store + append-only audit log
+# ------------
+
+GPT_LOG_FOLDER = 'output/gpt_log'
+CACHE_DB = os.path.join(GPT_LOG_FOLDER, 'cache.db')
+EVICT_CHECK_EVERY = 50
+
+_local = threading.local()
+_connections = []  # every thread's connection, so close_connections can reach them
+_generation = 0  # bumped by close_connections, threads then reopen
+_conn_lock = threading.Lock()
+_audit_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_inserts_since_check = 0
+
+def cache_key(model, base_url, prompt, resp_type):
+    payload = json.dumps([model, base_url, prompt, resp_type], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _connect():
+    # one connection per thread, reopened when the db was moved away or the connections were closed (e.g. by cleanup)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation == _generation and os.path.exists(CACHE_DB):
+        return conn
+    if conn is not None and _local.generation == _generation:
+        _forget(conn)
+        conn.close()
+    os.makedirs(GPT_LOG_FOLDER, exist_ok=True)
+    # only this thread uses it, close_connections may close it from another one
+    conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY, log_title TEXT, model TEXT, resp TEXT,
+        size INTEGER, created REAL, last_access REAL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+    with _conn_lock:
+        _connections.append(conn)
+        _local.conn, _local.generation = conn, _generation
+    return conn
+
+def _forget(conn):
+    with _conn_lock:
+        if conn in _connections:
+            _connections.remove(conn)
+
+def close_connections():
+    """Checkpoint the WAL into cache.db and close every thread's connection, call before cache.db is moved or deleted.
+    Threads that use the cache afterwards open a new connection."""
+    global _generation
+    with _conn_lock:
+        _generation += 1
+        connections = _connections[:]
+        _connections.clear()
+    for i, conn in enumerate(connections):
+        try:
+            if i == 0:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+        except sqlite3.Error as e:
+            rprint(f"[yellow]⚠️ Closing GPT cache connection failed: {e}[/yellow]")
+
+def load_cached(key):
+    """Return the cached response for key, or None"""
+    conn = _connect()
+    row = conn.execute("SELECT resp FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+    return json.loads(row[0])
+
+def save_cached(key, resp, model, log_title):
+    global _inserts_since_check
+    data = json.dumps(resp, ensure_ascii=False)
+    now = time.time()
+    _connect().execute(
+        "INSERT OR REPLACE INTO responses (key, log_title, model, resp, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (key, log_title, model, data, len(data.encode('utf-8')), now, now))
+    with _evict_lock:
+        _inserts_since_check += 1
+        if _inserts_since_check < EVICT_CHECK_EVERY:
+            return
+        _inserts_since_check = 0
+    _evict_lru()
+
+def _evict_lru():
+    """Drop least recently used entries until the store fits in gpt_cache.max_size_mb"""
+    max_bytes = load_key("gpt_cache.max_size_mb") * 1024 * 1024
+    conn = _connect()
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= max_bytes:
+        return
+    freed = 0
+    conn.execute("BEGIN")
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+        if total - freed <= max_bytes:
+            break
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        freed += size
+    conn.execute("COMMIT")
+
+def append_audit_log(log_title, record):
+    """Append one response record to output/gpt_log/<log_title>.jsonl for inspection"""
+    os.makedirs(GPT_LOG_FOLDER, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False)
+    with _audit_lock:
+        with open(os.path.join(GPT_LOG_FOLDER, f"{log_title}.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+# ------------
+# shared tier: content-addressed entries in a shared directory or behind a small http service
+# ------------
+
+SHARED_QUOTA_CHECK_EVERY = 100
+SHARED_MAX_ENTRY_BYTES = 4 * 1024 * 1024  # one LLM response, larger PUTs are refused
+TOKEN_HEADER = 'X-Cache-Token'
+_shared_writes = 0
+_http = requests.Session()
+
+def _shared_path(root, key):
+    return os.path.join(root, key[:2], f"{key}.json")
+
+def shared_dir_get(root, key, ttl):
+    path = _shared_path(root, key)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            os.remove(path)
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def shared_dir_put(root, key, resp, ttl, max_bytes):
+    global _shared_writes
+    path = _shared_path(root, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(resp, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    with _evict_lock:
+        _shared_writes += 1
+        if _shared_writes % SHARED_QUOTA_CHECK_EVERY:
+            return
+    enforce_shared_quota(root, ttl, max_bytes)
+
+def enforce_shared_quota(root, ttl, max_bytes):
+    """Remove expired entries, then the oldest ones until the directory fits in max_bytes"""
+    entries, now = [], time.time()
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > ttl:
+                    os.remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                pass  # removed by another worker
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _shared_settings():
+    shared = load_key("gpt_cache.shared")
+    if not shared:
+        return None
+    ttl = load_key("gpt_cache.shared_ttl_hours") * 3600
+    max_bytes = load_key("gpt_cache.shared_max_size_mb") * 1024 * 1024
+    return shared, ttl, max_bytes
+
+def _token_headers():
+    token = load_key("gpt_cache.shared_token")
+    return {TOKEN_HEADER: token} if token else {}
+
+def _shared_get(key):
+    settings = _shared_settings()
+    if settings is None:
+        return None
+    shared, ttl, _ = settings
+    try:
+        if shared.startswith('http'):
+            resp = _http.get(f"{shared.rstrip('/')}/cache/{key}", headers=_token_headers(), timeout=5)
+            return resp.json() if resp.status_code == 200 else None
+        return shared_dir_get(shared, key, ttl)
+    except Exception as e:
+        rprint(f"[yellow]⚠️ Shared GPT cache lookup failed: {e}[/yellow]")
+        return None
+
+def _shared_put(key, resp):
+    settings = _shared_settings()
+    if settings is None:
+        return
+    shared, ttl, max_bytes = settings
+    try:
+        if shared.startswith('http'):
+            _http.put(f"{shared.rstrip('/')}/cache/{key}", data=json.dumps(resp, ensure_ascii=False).encode('utf-8'), headers=_token_headers(), timeout=5)
+        else:
+            shared_dir_put(shared, key, resp, ttl, max_bytes)
+    except Exception as e:
+        rprint(f"[yellow]⚠️ Shared GPT cache write failed: {e}[/yellow]")
+
+# ------------
+# tiered lookup
+# ------------
+
+def lookup(key, log_title):
+    """Local tier first, then the shared tier. Shared hits are copied into the local tier.
+    Returns (resp or None, "local_hit" / "shared_hit" / "miss")"""
+    resp = load_cached(key)
+    if resp is not None:
+        return resp, "local_hit"
+    resp = _shared_get(key)
+    if resp is not None:
+        save_cached(key, resp, None, log_title)
+        return resp, "shared_hit"
+    return None, "miss"
+
+def store(key, resp, model, log_title):
+    save_cached(key, resp, model, log_title)
+    _shared_put(key, resp)
+
+# ------------
+# shared cache service: python -m core.utils.gpt_cache serve <dir> [port] [--host 0.0.0.0] [--token secret]
+# ------------
+
+def serve_shared_cache(root, port=8790, host='127.0.0.1', ttl_hours=720, max_size_mb=2048, token=''):
+    """Listens on localhost unless another host is given. With a token, requests without the matching X-Cache-Token header get 403,
+    without one anybody who can reach the port can read and overwrite cached answers"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    ttl, max_bytes = ttl_hours * 3600, max_size_mb * 1024 * 1024
+
+    class CacheHandler(BaseHTTPRequestHandler):
+        def _key(self):
+            key = self.path.rstrip('/').rsplit('/', 1)[-1]
+            return key if len(key) == 64 and all(c in '0123456789abcdef' for c in key) else None
+
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def _authorized(self):
+            if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), token):
+                self._reply(403)
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            key = self._key()
+            resp = shared_dir_get(root, key, ttl) if key else None
+            if resp is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = json.dumps(resp, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PUT(self):
+            if not self._authorized():
+                return
+            key = self._key()
+            try:
+                length = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                length = -1
+            if key is None or length < 0:
+                self._reply(400)
+                return
+            if length > SHARED_MAX_ENTRY_BYTES:
+                self.close_connection = True  # the body is not read
+                self._reply(413)
+                return
+            try:
+                resp = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._reply(400)
+                return
+            shared_dir_put(root, key, resp, ttl, max_bytes)
+            self._reply(204)
+
+        def log_message(self, format, *args):
+            pass
+
+    rprint(f"[green]🗄️ Serving shared GPT cache from {root} on http://{host}:{port}{'' if token else ' without a token'}[/green]")
+    ThreadingHTTPServer((host, port), CacheHandler).serve_forever()
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == 'serve':
+        import argparse
+        parser = argparse.ArgumentParser(prog="python -m core.utils.gpt_cache serve", description="Shared GPT cache service")
+        parser.add_argument("root", help="directory holding the shared entries")
+        parser.add_argument("port", type=int, nargs="?", default=8790)
+        parser.add_argument("--host", default="127.0.0.1", help="interface to listen on, e.g. 0.0.0.0 to accept other machines")
+        parser.add_argument("--token", default=os.environ.get("GPT_CACHE_TOKEN", ""),
+                            help="required X-Cache-Token header, default $GPT_CACHE_TOKEN; set the same gpt_cache.shared_token on the workers")
+        args = parser.parse_args(sys.argv[2:])
+        serve_shared_cache(args.root, port=args.port, host=args.host, token=args.token)
+        sys.exit(0)
+    # lookup / insert cost should stay flat as the cache grows, measured on a scratch db so the real cache is left alone
+    import tempfile
+    with tempfile.TemporaryDirectory() as scratch:
+        GPT_LOG_FOLDER = scratch
+        CACHE_DB = os.path.join(scratch, 'cache.db')
+        n = 5000
+        keys = [cache_key("model", "base_url", f"prompt {i}", "json") for i in range(n)]
+        start = time.perf_counter()
+        for key in keys:
+            save_cached(key, {"result": key}, "model", "benchmark")
+        insert_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in keys:
+            assert load_cached(key) == {"result": key}
+        lookup_time = time.perf_counter() - start
+        close_connections()
+    print(f"{n} entries: insert {insert_time / n * 1e6:.0f} us/op, lookup {lookup_time / n * 1e6:.0f} us/op")
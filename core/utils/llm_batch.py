@@ -0,0 +1,122 @@
+import copy
+import asyncio
+from collections import defaultdict
+from rich import print as rprint
+from rich.table import Table
+from core.utils.config_utils import load_key
+from core.utils.ask_gpt import ask_gpt_async, stream_expect_keys
+
+# ------------
+# request batching: pack pending prompts of one kind into a single LLM call with keyed sub-results
+# ------------
+
+_BATCH_STATS = defaultdict(lambda: {"items": 0, "deduped": 0, "batches": 0, "batched_items": 0, "fallbacks": 0})
+
+def _valid_batch(response_data):
+    if not isinstance(response_data, dict):
+        return {"status": "error", "message": "Batch response is not a JSON object keyed by item id"}
+    return {"status": "success", "message": "Batch completed"}
+
+class PromptBatcher:
+    """Coalesce up to `llm_batch.<kind>` pending items into one prompt built by build_prompt({id: payload}).
+    Each sub-result is checked with valid_item(payload, sub_result), the items that fail are sent alone with single(payload).
+    Lives on the LLM engine loop, so submit() must be awaited there (e.g. inside run_all)."""
+    def __init__(self, kind, log_title, build_prompt, valid_item, single):
+        self.kind = kind
+        self.log_title = log_title
+        self.build_prompt = build_prompt
+        self.valid_item = valid_item
+        self.single = single
+        self.pending = []
+        self.timer = None
+
+    async def submit(self, payload):
+        stats = _BATCH_STATS[self.log_title]
+        stats["items"] += 1
+        if load_key(f"llm_batch.{self.kind}") <= 1:
+            return await self.single(payload)
+        for queued, future in self.pending:
+            if queued == payload:
+                # repeated sentence waiting in the same batch: share its item instead of asking twice
+                stats["deduped"] += 1
+                return copy.deepcopy(await asyncio.shield(future))
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((payload, future))
+        if len(self.pending) >= load_key(f"llm_batch.{self.kind}"):
+            self._flush_now()
+        elif self.timer is None:
+            # wait a moment for the other coroutines of the same run_all to queue their items
+            self.timer = asyncio.get_running_loop().call_later(load_key("llm_batch.wait_ms") / 1000, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        items, self.pending = self.pending, []
+        if items:
+            asyncio.create_task(self._run(items))
+
+    async def _resolve_single(self, payload, future):
+        try:
+            result = await self.single(payload)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _run(self, items):
+        stats = _BATCH_STATS[self.log_title]
+        if len(items) == 1:
+            await self._resolve_single(*items[0])
+            return
+
+        keyed = {str(i + 1): item for i, item in enumerate(items)}
+        prompt = self.build_prompt({key: payload for key, (payload, _) in keyed.items()})
+        # only unknown ids abort the stream, a missing or bad item is cheaper to redo alone than the whole batch
+        try:
+            response_data = await ask_gpt_async(prompt, resp_type='json', valid_def=_valid_batch, log_title=f"{self.log_title}_batch",
+                                                stream_check=stream_expect_keys(list(keyed)))
+        except Exception as e:
+            rprint(f"[yellow]⚠️ Batched {self.log_title} request failed, sending {len(items)} items one by one: {e}[/yellow]")
+            response_data = {}
+        stats["batches"] += 1
+
+        failed = []
+        for key, (payload, future) in keyed.items():
+            sub_result = response_data.get(key)
+            try:
+                valid = self.valid_item(payload, sub_result) if isinstance(sub_result, dict) else {"status": "error", "message": f"Missing result for item {key}"}
+            except Exception as e:
+                valid = {"status": "error", "message": str(e)}
+            if valid["status"] == "success":
+                stats["batched_items"] += 1
+                if not future.done():
+                    future.set_result(sub_result)
+            else:
+                failed.append((payload, future))
+        if failed:
+            stats["fallbacks"] += len(failed)
+            rprint(f"[yellow]⚠️ {len(failed)}/{len(items)} {self.log_title} items of a batch were invalid, retrying them one by one[/yellow]")
+            await asyncio.gather(*(self._resolve_single(payload, future) for payload, future in failed))
+
+def get_batch_stats():
+    return {title: dict(stats) for title, stats in _BATCH_STATS.items()}
+
+def reset_batch_stats():
+    _BATCH_STATS.clear()
+
+def report_batch_stats(log_titles):
+    stats = get_batch_stats()
+    titles = [t for t in log_titles if stats.get(t, {}).get("batches")]
+    if not titles:
+        return
+    table = Table(title="📦 Batched requests")
+    for column in ("log_title", "items", "deduped", "batches", "served by batch", "single fallbacks"):
+        table.add_column(column)
+    for title in titles:
+        counts = stats[title]
+        table.add_row(title, str(counts["items"]), str(counts["deduped"]), str(counts["batches"]), str(counts["batched_items"]), str(counts["fallbacks"]))
+    rprint(table)
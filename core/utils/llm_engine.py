@@ -0,0 +1,264 @@
+import re
+import time
+import asyncio
+import statistics
+import threading
+from collections import deque
+from openai import RateLimitError, APITimeoutError
+from rich import print as rprint
+from core.utils.config_utils import load_key
+
+# ------------
+# one background event loop shared by every LLM call in the process
+# ------------
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="llm-engine", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+def run_sync(coro):
+    """Run a coroutine on the engine loop and block the calling thread until it finishes.
+    The caller's context (e.g. the job config overlay) is carried over to the coroutine."""
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync called from the LLM engine loop, await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def submit(coro):
+    """Start a coroutine on the engine loop without waiting for it, returns a concurrent.futures.Future.
+    Like run_sync, the caller's context is carried over."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+def run_all(coros, on_done=None, return_exceptions=False):
+    """Run coroutines concurrently on the engine loop and return their results in order.
+    on_done(index, result) is called in the engine loop as each one finishes."""
+    async def _run(index, coro):
+        try:
+            result = await coro
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            result = e
+        if on_done is not None:
+            on_done(index, result)
+        return result
+
+    async def _gather():
+        return await asyncio.gather(*(_run(i, c) for i, c in enumerate(coros)))
+    return run_sync(_gather())
+
+# ------------
+# scheduler: global in-flight limit + per-endpoint RPM / TPM token buckets
+# ------------
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount=1):
+        """Take `amount` tokens once available, returns what was taken (see refund)"""
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return amount
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount):
+        """Give back tokens of a request that was never sent"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+# ------------
+# adaptive (AIMD) concurrency window per endpoint
+# ------------
+
+class AdaptiveLimiter:
+    """Additive increase while latency stays healthy, multiplicative decrease on 429s, timeouts or latency spikes.
+    A 429 also pauses every request to the endpoint for its Retry-After."""
+    def __init__(self, name, initial, minimum, maximum, latency_tolerance):
+        self.name = name
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.inflight = 0
+        self.waiters = deque()
+        self.latencies = deque(maxlen=100)
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+
+    async def acquire(self):
+        while True:
+            pause = self.blocked_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self.inflight < int(self.window):
+                self.inflight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # woken and cancelled before taking the slot: wake someone else for it
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+
+    def release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = int(self.window) - self.inflight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _decrease(self, factor, reason):
+        # react once per congestion event, not once per request that was already in flight
+        now = time.monotonic()
+        recent = statistics.median(self.latencies) if self.latencies else 1.0
+        if now - self.last_decrease < recent:
+            return
+        self.last_decrease = now
+        self.window = max(self.minimum, self.window * factor)
+        rprint(f"[yellow]🚦 {reason}, LLM concurrency for {self.name} -> {int(self.window)}[/yellow]")
+
+    def on_success(self, latency):
+        self.latencies.append(latency)
+        if len(self.latencies) >= 20:
+            # compare the recent median with the long-run one, so a single slow outlier is not read as congestion
+            recent = statistics.median(list(self.latencies)[-10:])
+            baseline = statistics.median(self.latencies)
+            if recent > baseline * self.latency_tolerance:
+                self._decrease(0.8, f"recent latency {recent:.1f}s is {recent / baseline:.1f}x the median")
+                return
+        self.window = min(self.maximum, self.window + 1 / self.window)
+        self._wake()
+
+    def on_rate_limited(self, retry_after):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        self._decrease(0.5, f"rate limited, pausing {retry_after:.1f}s")
+
+    def on_timeout(self):
+        self._decrease(0.5, "request timed out")
+
+# keyed on the endpoint and the llm_engine values read at request time, so sidebar edits and per-job overrides
+# get a limiter of their own instead of the one built from whatever was configured first
+_limiters = {}
+
+def _get_limiter(base_url):
+    engine = load_key("llm_engine")
+    if engine["adaptive"]:
+        settings = (engine["initial_inflight"], engine["min_inflight"], engine["max_inflight"], engine["latency_tolerance"])
+    else:
+        settings = (engine["max_inflight"], engine["max_inflight"], engine["max_inflight"], float('inf'))
+    key = (base_url, settings)
+    if key not in _limiters:
+        _limiters[key] = AdaptiveLimiter(base_url, *settings)
+    return _limiters[key]
+
+def get_concurrency_windows():
+    """Current in-flight window per endpoint (of its most recently created limiter)"""
+    return {base_url: int(limiter.window) for (base_url, _), limiter in _limiters.items()}
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+_inflight = {}  # max_inflight -> semaphore shared by every request made under that limit
+_buckets = {}
+
+# ------------
+# token counting: tiktoken when it is installed (and its encoding is available offline), a script-aware estimate otherwise
+# ------------
+
+_encoder = None  # False once tiktoken turned out to be unusable
+_WIDE_CHARS = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\uffef]')
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = False
+    return _encoder
+
+def estimate_tokens(text):
+    encoder = _get_encoder()
+    if encoder:
+        return max(1, len(encoder.encode(text, disallowed_special=())))
+    # CJK / Hangul characters are about one token each, other text about 4 characters per token
+    wide = len(_WIDE_CHARS.findall(text))
+    return max(1, wide + (len(text) - wide) // 4)
+
+class _Slot:
+    """async with request_slot(base_url, prompt): waits for the rate limits and a concurrency slot,
+    then reports the outcome of the request to the endpoint's adaptive limiter"""
+    def __init__(self, base_url, tokens):
+        self.base_url = base_url
+        self.tokens = tokens
+        self.limiter = _get_limiter(base_url)
+
+    async def __aenter__(self):
+        max_inflight = load_key("llm_engine.max_inflight")
+        # remembered so __aexit__ releases this semaphore even if the limit changes meanwhile
+        self.inflight = _inflight.setdefault(max_inflight, asyncio.Semaphore(max_inflight))
+        rpm, tpm = load_key("llm_engine.rpm"), load_key("llm_engine.tpm")
+        # a request cancelled while it waits (e.g. the hedge that lost the race) never reaches __aexit__,
+        # so whatever it already holds is given back here
+        reserved, limited = [], False
+        try:
+            if rpm:
+                bucket = _buckets.setdefault((self.base_url, "rpm", rpm), TokenBucket(rpm))
+                reserved.append((bucket, await bucket.acquire(1)))
+            if tpm:
+                bucket = _buckets.setdefault((self.base_url, "tpm", tpm), TokenBucket(tpm))
+                reserved.append((bucket, await bucket.acquire(self.tokens)))
+            await self.limiter.acquire()
+            limited = True
+            await self.inflight.acquire()
+        except BaseException:
+            if limited:
+                self.limiter.release()
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            raise
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.inflight.release()
+        self.limiter.release()
+        if exc is None:
+            self.limiter.on_success(time.monotonic() - self.start)
+        elif isinstance(exc, RateLimitError):
+            self.limiter.on_rate_limited(_retry_after(exc))
+        elif isinstance(exc, (APITimeoutError, asyncio.TimeoutError)):
+            self.limiter.on_timeout()
+
+def request_slot(base_url, prompt):
+    return _Slot(base_url, estimate_tokens(prompt))
@@ -0,0 +1,481 @@
+import os
+import re
+import glob
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from rich import print as rprint
+
+# ------------
+# OpenAI-compatible stand-in for offline benchmarks
+#   1. replays answers recorded in gpt_log (by prompt hash)
+#   2. otherwise synthesizes a schema-valid answer for the prompts of core/prompts.py
+#   3. otherwise answers with the fixed server.content
+# ------------
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def load_replay_index(folder='output/gpt_log'):
+    """{prompt hash: resp_content} from the audit logs (<log_title>.jsonl) and the older <log_title>.json dumps"""
+    index = {}
+    for path in sorted(glob.glob(os.path.join(folder, '*.json')) + glob.glob(os.path.join(folder, '*.jsonl'))):
+        if os.path.basename(path).startswith('error.'):
+            continue  # invalid answers are not worth replaying
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)
+        for record in records:
+            if record.get("prompt") and record.get("resp_content"):
+                index[prompt_hash(record["prompt"])] = record["resp_content"]
+    return index
+
+# ------------
+# synthesized answers, one per prompt of core/prompts.py
+# ------------
+
+def _split_evenly(text, num_parts):
+    """Split text into num_parts pieces of similar length, on words when there are spaces"""
+    words = text.split()
+    units, joiner = (words, ' ') if len(words) >= num_parts else (list(text), '')
+    num_parts = max(1, min(num_parts, len(units)))
+    size = len(units) / num_parts
+    return [joiner.join(units[round(i * size):round((i + 1) * size)]) for i in range(num_parts)]
+
+def _synth_split(sentence, num_parts):
+    split = " [br] ".join(_split_evenly(sentence, num_parts))
+    return {"analysis": "synthetic", "split1": split, "split2": split, "assess": "synthetic", "choice": "1"}
+
+def _synth_align(block):
+    originals = re.findall(r'Original: "(.*)"', block)
+    src_parts = re.search(r'\(\[br\] indicates split points\): (.*)', block).group(1).split(' [br] ')
+    tr_sub = originals[1] if len(originals) > 1 else originals[0]
+    tr_parts = _split_evenly(tr_sub, len(src_parts))
+    tr_parts += [tr_parts[-1]] * (len(src_parts) - len(tr_parts))  # never leave a part empty
+    return {"analysis": "synthetic", "align": [{f"src_part_{i+1}": src, f"target_part_{i+1}": tr}
+                                              for i, (src, tr) in enumerate(zip(src_parts, tr_parts))]}
+
+def _json_template(prompt):
+    """The example output of the prompt, which lists the expected keys"""
+    blocks = re.findall(r'```json\n(.*?)\n```', prompt, re.DOTALL)
+    return json.loads(blocks[-1])
+
+def synthesize_answer(prompt):
+    """A schema-valid answer for the prompts of core/prompts.py, or None for unknown prompts"""
+    if '<split_this_sentence>' in prompt:
+        sentence = re.search(r'<split_this_sentence>\n(.*?)\n</split_this_sentence>', prompt, re.DOTALL).group(1)
+        return _synth_split(sentence, int(re.search(r'into \*\*(\d+)\*\* parts', prompt).group(1)))
+    if '<sentence id="' in prompt:
+        return {key: _synth_split(sentence, int(parts))
+                for key, parts, sentence in re.findall(r'<sentence id="(\w+)" parts="(\d+)" word_limit="\d+">\n(.*?)\n</sentence>', prompt, re.DOTALL)}
+    if '<subtitle id="' in prompt:
+        return {key: _synth_align(block) for key, block in re.findall(r'<subtitle id="(\w+)" parts="\d+">\n(.*?)\n</subtitle>', prompt, re.DOTALL)}
+    if '[br] indicates split points' in prompt:
+        return _synth_align(prompt)
+    if '"theme"' in prompt and '"terms"' in prompt:
+        return {"theme": "Synthetic summary of the video. It is used for offline benchmarks.", "terms": []}
+    if re.search(r'"1": "(direct|free) .* translation of line 1"', prompt):
+        # compact format: the (direct) translation of each numbered input line
+        subtitles = re.findall(r'<subtitles>\n(.*?)\n</subtitles>', prompt, re.DOTALL)[-1]
+        if '"free ' in prompt:
+            return dict(re.findall(r'^\[(\d+)\] .*\n    direct: (.*)$', subtitles, re.MULTILINE))
+        return dict(re.findall(r'^\[(\d+)\] (.*)$', subtitles, re.MULTILINE))
+    if '"reflect"' in prompt and '"free"' in prompt:
+        return {key: {**item, "reflect": "synthetic", "free": item["direct"]} for key, item in _json_template(prompt).items()}
+    if '"direct"' in prompt and '"origin"' in prompt:
+        return {key: {"origin": item["origin"], "direct": item["origin"]} for key, item in _json_template(prompt).items()}
+    if 'Duration:' in prompt and '"result"' in prompt:
+        words = re.search(r'Subtitle: "(.*)"', prompt).group(1).split()
+        return {"analysis": "synthetic", "result": " ".join(words[:max(1, int(len(words) * 0.8))])}
+    if 'text cleaning expert for TTS' in prompt:
+        text = re.search(r'## INPUT\n(.*?)\n\n## Output', prompt, re.DOTALL).group(1)
+        return {"text": re.sub(r'[^\w\s.,?!]', '', text)}
+    return None
+
+# ------------
+# server
+# ------------
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse connections
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not data:
+            return  # the client dropped the request, e.g. a cancelled hedge
+        body = json.loads(data)
+        server = self.server
+        with server.rng_lock:
+            throttled = server.rng.random() < server.rate_429
+            slow = server.rng.random() < server.tail_rate
+            jitter = server.rng.uniform(-server.jitter, server.jitter)
+        if throttled:
+            self._send_json(429, {"error": {"message": "Rate limit reached (stand-in)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                            {"Retry-After": str(server.retry_after)})
+            return
+        time.sleep(max(0.0, (server.tail_latency if slow else server.latency) + jitter))
+
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = self._answer(prompt)
+        prompt_tokens = len(prompt) // 4
+        self.usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4,
+                      "prompt_tokens_details": {"cached_tokens": self._cached_tokens(prompt)}}
+        if body.get("stream"):
+            self._stream(body, content)
+            return
+        # the whole answer is generated before it is sent
+        time.sleep(-(-len(content) // server.chunk_size) * server.chunk_delay)
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": self.usage,
+        })
+
+    def _cached_tokens(self, prompt):
+        """Emulate a provider prefix cache: the longest prefix shared with a recent prompt,
+        counted in blocks of 128 tokens from 1024 tokens on (4 characters per token)"""
+        server = self.server
+        with server.rng_lock:
+            shared = max((len(os.path.commonprefix([prompt, seen])) for seen in server.recent_prompts), default=0)
+            server.recent_prompts.append(prompt)
+        tokens = shared // 4
+        return tokens // 128 * 128 if tokens >= 1024 else 0
+
+    def _answer(self, prompt):
+        server = self.server
+        replayed = server.replay.get(prompt_hash(prompt))
+        if replayed is not None:
+            server.counts["replayed"] += 1
+            return replayed
+        synthesized = synthesize_answer(prompt) if server.synthesize else None
+        if synthesized is not None:
+            server.counts["synthesized"] += 1
+            return f"```json\n{json.dumps(synthesized, ensure_ascii=False, indent=2)}\n```"
+        server.counts["fixed"] += 1
+        return server.content
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on this request, e.g. a hedged duplicate was cancelled
+
+    def _stream(self, body, content):
+        """Server-sent events, chunk_size characters every chunk_delay seconds"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        size = self.server.chunk_size
+        try:
+            for i in range(0, len(content), size):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "stub"),
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                time.sleep(self.server.chunk_delay)
+            if body.get("stream_options", {}).get("include_usage"):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "stub"),
+                         "choices": [], "usage": self.usage}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client aborted the stream
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # benchmarks open many connections at once
+
+def start_stub_server(port=0, latency=0.0, tail_rate=0.0, tail_latency=0.0, content='{"code": 200, "message": "success"}', chunk_size=20, chunk_delay=0.0,
+                      jitter=0.0, rate_429=0.0, retry_after=1.0, replay_dir=None, synthesize=True, seed=0, host='127.0.0.1'):
+    """Start the stand-in in a daemon thread and return (server, base_url).
+    Each request takes latency ± jitter seconds, a tail_rate share takes tail_latency instead and a rate_429 share is refused with Retry-After.
+    Streamed answers send content chunk_size characters at a time, every chunk_delay seconds.
+    Random draws come from one generator seeded with seed, so a run with the same requests is reproducible."""
+    server = StubServer((host, port), StubHandler)
+    server.latency = latency
+    server.tail_rate = tail_rate
+    server.tail_latency = tail_latency
+    server.content = content
+    server.chunk_size = chunk_size
+    server.chunk_delay = chunk_delay
+    server.jitter = jitter
+    server.rate_429 = rate_429
+    server.retry_after = retry_after
+    server.synthesize = synthesize
+    server.replay = load_replay_index(replay_dir) if replay_dir else {}
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.counts = {"replayed": 0, "synthesized": 0, "fixed": 0}
+    server.recent_prompts = deque(maxlen=256)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+# ------------
+# benchmark: new client per request vs pooled client
+# ------------
+
+def benchmark_client_pool(n=200):
+    from openai import OpenAI
+    from core.utils.ask_gpt import get_client
+    from core.utils.llm_engine import run_sync
+    server, base_url = start_stub_server()
+    messages = [{"role": "user", "content": "ping"}]
+
+    def fresh():
+        client = OpenAI(api_key="stub", base_url=base_url)
+        client.chat.completions.create(model="stub", messages=messages)
+        client.close()
+
+    def pooled():
+        run_sync(get_client(base_url, "stub").chat.completions.create(model="stub", messages=messages))
+
+    results = {}
+    for name, func in (("fresh client", fresh), ("pooled client", pooled)):
+        func()
+        start = time.perf_counter()
+        for _ in range(n):
+            func()
+        results[name] = (time.perf_counter() - start) / n * 1000
+    server.shutdown()
+    for name, ms in results.items():
+        rprint(f"[cyan]{name}:[/cyan] {ms:.2f} ms/request")
+    rprint(f"[green]saved {results['fresh client'] - results['pooled client']:.2f} ms per request[/green]")
+    return results
+
+# ------------
+# benchmark: hedged requests against a stub with a slow tail
+# ------------
+
+def benchmark_hedging(n=200, latency=0.05, tail_rate=0.05, tail_latency=2.0):
+    from core.utils.config_utils import job_config
+    from core.utils.ask_gpt import ask_gpt_async, get_hedge_stats
+    from core.utils.llm_engine import run_all
+    server, base_url = start_stub_server(latency=latency, tail_rate=tail_rate, tail_latency=tail_latency)
+    results = {}
+    for enabled in (False, True):
+        log_title = f"bench_hedge_{'on' if enabled else 'off'}"
+        overrides = {"api.base_url": base_url, "api.key": "stub", "llm_engine.adaptive": False,
+                     "llm_hedge.enabled": enabled, "llm_hedge.percentile": 90, "llm_hedge.min_samples": 10}
+        with job_config(overrides, manifest=None):
+            # warm up the latency history, then measure distinct prompts so nothing comes from the cache
+            run_all([ask_gpt_async(f"{log_title} warmup {i} {time.time()}", log_title=log_title) for i in range(20)])
+            start = time.perf_counter()
+            run_all([ask_gpt_async(f"{log_title} {i} {time.time()}", log_title=log_title) for i in range(n)])
+            results[log_title] = time.perf_counter() - start
+        rprint(f"[cyan]hedging {'on' if enabled else 'off'}:[/cyan] {n} requests in {results[log_title]:.2f}s")
+    server.shutdown()
+    rprint(get_hedge_stats().get("bench_hedge_on"))
+    return results
+
+# ------------
+# benchmark: a malformed translation answer, waited out in full vs aborted while streaming
+# ------------
+
+def benchmark_stream_abort(lines=40, chunk_delay=0.01):
+    from core.utils.config_utils import job_config
+    from core.utils.ask_gpt import _ask_gpt_with_retry, stream_expect_keys, get_stream_stats
+    from core.utils.llm_telemetry import new_call
+    from core.utils.llm_engine import run_sync
+    from core.translate_lines import valid_translate_result
+    required_keys = [str(i) for i in range(1, lines + 1)]
+    valid = json.dumps({k: {"origin": f"line {k}", "direct": f"translated line {k}"} for k in required_keys}, indent=4)
+    # the model drifts into its own key scheme after the first line
+    broken = json.dumps({"1": {"origin": "line 1", "direct": "translated line 1"},
+                         **{f"line_{k}": {"origin": f"line {k}", "direct": f"translated line {k}"} for k in required_keys[1:]}}, indent=4)
+    server, base_url = start_stub_server(content=valid, chunk_delay=chunk_delay)
+    # a single attempt, without the retry decorator
+    ask_once = _ask_gpt_with_retry.__wrapped__
+    results = {}
+    for enabled in (False, True):
+        overrides = {"api.base_url": base_url, "api.key": "stub", "llm_stream.enabled": enabled}
+        with job_config(overrides, manifest=None):
+            def ask(tag):
+                return ask_once(f"translate {tag} {time.time()}", 'json', lambda r: valid_translate_result(r, required_keys, ['direct']),
+                                "bench_stream", stream_expect_keys(required_keys, ['direct'], ordered=True), new_call("bench_stream", None))
+            server.content = valid
+            run_sync(ask("warmup"))
+            server.content = broken
+            start = time.perf_counter()
+            try:
+                run_sync(ask("broken"))
+            except ValueError as e:
+                rprint(f"[yellow]{e}[/yellow]")
+            results[enabled] = time.perf_counter() - start
+        rprint(f"[cyan]streaming {'on' if enabled else 'off'}:[/cyan] malformed answer rejected after {results[enabled]:.2f}s")
+    server.shutdown()
+    stats = get_stream_stats()["bench_stream"]
+    rprint(f"TTFT {stats['ttft'][-1]:.3f}s, aborts {stats['aborts']}, estimated time saved {stats['time_saved']:.2f}s")
+    return results
+
+# ------------
+# benchmark: cached prompt tokens with the classic and the prefix_cache translation prompt layout
+# ------------
+
+def benchmark_prompt_layout(chunks=20, terms=40):
+    from core.utils.config_utils import job_config
+    from core.utils.ask_gpt import ask_gpt_async
+    from core.utils.llm_engine import run_all
+    from core.utils.llm_telemetry import get_telemetry
+    from core.prompts import generate_shared_prompt, get_prompt_faithfulness, get_prefix_faithfulness, get_chunk_prompt, get_faithfulness_json_format, get_glossary_prompt
+    server, base_url = start_stub_server()
+    theme = "A long lecture about building video translation pipelines. It covers speech recognition, translation and dubbing."
+    glossary = [{"src": f"term {i}", "tgt": f"术语 {i}", "note": f"explanation of term number {i} used in the lecture"} for i in range(terms)]
+    texts = [[f"chunk {c} line {l}: some spoken sentence about term {(c + l) % terms} {time.time()}" for l in range(8)] for c in range(chunks)]
+    glossary_prompt = get_glossary_prompt(glossary)
+    for layout in ("classic", "prefix_cache"):
+        prompts = []
+        for c, lines in enumerate(texts):
+            lines = "\n".join(lines)
+            previous, after = texts[c - 1][-3:] if c else None, texts[c + 1][:2] if c + 1 < chunks else None
+            notes = get_glossary_prompt([glossary[(c + l) % terms] for l in range(8)])
+            if layout == "classic":
+                prompts.append(get_prompt_faithfulness(lines, generate_shared_prompt(previous, after, theme, notes)))
+            else:
+                prompts.append(get_chunk_prompt(get_prefix_faithfulness(theme, glossary_prompt), lines, previous, after, notes, get_faithfulness_json_format(lines)))
+        with job_config({"api.base_url": base_url, "api.key": "stub"}, manifest=None):
+            # the first chunk warms the provider cache, like the first chunk of a real run
+            run_all([ask_gpt_async(prompts[0], log_title=f"bench_layout_{layout}")])
+            run_all([ask_gpt_async(p, log_title=f"bench_layout_{layout}") for p in prompts[1:]])
+    server.shutdown()
+    for layout in ("classic", "prefix_cache"):
+        s = get_telemetry([f"bench_layout_{layout}"])[f"bench_layout_{layout}"]
+        rprint(f"[cyan]{layout}:[/cyan] {s['prompt_tokens']} prompt tokens, {s['cached_tokens']} cached ({s['cached_tokens'] / s['prompt_tokens']:.0%})")
+
+# ------------
+# benchmark: repetitive content (lyrics, intros) with concurrent identical prompts
+# ------------
+
+def benchmark_single_flight(n=200, distinct=20, latency=0.2):
+    from core.utils.config_utils import job_config
+    from core.utils.ask_gpt import ask_gpt_async
+    from core.utils.llm_engine import run_all
+    from core.utils.llm_telemetry import get_telemetry
+    server, base_url = start_stub_server(latency=latency)
+    run_id = time.time()
+    with job_config({"api.base_url": base_url, "api.key": "stub"}, manifest=None):
+        start = time.perf_counter()
+        run_all([ask_gpt_async(f"chorus line {i % distinct} {run_id}", log_title="bench_single_flight") for i in range(n)])
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+    s = get_telemetry(["bench_single_flight"])["bench_single_flight"]
+    rprint(f"[cyan]{n} calls, {distinct} distinct prompts:[/cyan] {sum(server.counts.values())} requests reached the server, "
+           f"{s['inflight_hit']} shared an in-flight request, {elapsed:.2f}s")
+
+# ------------
+# benchmark: per-chunk latency and output tokens of the full and the compact translation format
+# ------------
+
+def benchmark_translate_format(chunks=10, lines=12, chunk_delay=0.01):
+    """Both translation steps per chunk, the stand-in streams 20 characters every chunk_delay seconds like a model generating"""
+    from core.utils.config_utils import job_config
+    from core.utils.llm_engine import run_sync
+    from core.utils.llm_telemetry import get_telemetry
+    import core.translate_lines as translate_lines
+    server, base_url = start_stub_server(chunk_delay=chunk_delay)
+    texts = ["\n".join(f"chunk {c} line {l}: a spoken sentence of moderate length about video translation {time.time()}" for l in range(lines))
+             for c in range(chunks)]
+    log_titles = ["translate_faithfulness", "translate_expressiveness"]
+    translate_lines.console.quiet = True
+    results = {}
+    for fmt in ("full", "compact"):
+        before = get_telemetry(log_titles)
+        latencies = []
+        with job_config({"api.base_url": base_url, "api.key": "stub", "translate_format": fmt, "reflect_translate": True}, manifest=None):
+            for c, text in enumerate(texts):
+                start = time.perf_counter()
+                run_sync(translate_lines.translate_lines_async(text, None, None, None, "theme", c))
+                latencies.append(time.perf_counter() - start)
+        after = get_telemetry(log_titles)
+        tokens = sum(after[t]["completion_tokens"] - before.get(t, {}).get("completion_tokens", 0) for t in log_titles)
+        results[fmt] = {"chunk_latency": sorted(latencies)[len(latencies) // 2], "output_tokens": tokens / chunks}
+        rprint(f"[cyan]{fmt}:[/cyan] median {results[fmt]['chunk_latency']:.2f}s per chunk, {results[fmt]['output_tokens']:.0f} output tokens per chunk")
+    translate_lines.console.quiet = False
+    server.shutdown()
+    return results
+
+# ------------
+# benchmark: the LLM stages _3_2 to _5 end to end against the stand-in
+# ------------
+
+def benchmark_pipeline(**server_options):
+    """Run split by meaning, summary, translation and subtitle splitting with the stand-in as api.base_url.
+    Needs output/log/split_by_nlp.txt from an earlier run (_3_1), stages whose output already exists are skipped,
+    so run it on a scratch copy of output/. Each run listens on a new port, so nothing is served from the GPT cache."""
+    from core.utils.config_utils import job_config
+    from core._3_2_split_meaning import split_sentences_by_meaning
+    from core._4_1_summarize import get_summary
+    from core._4_2_translate import translate_all
+    from core._5_split_sub import split_for_sub_main
+    server, base_url = start_stub_server(**server_options)
+    timings = {}
+    with job_config({"api.base_url": base_url, "api.key": "stub"}, manifest=None):
+        for name, stage in (("_3_2 split by meaning", split_sentences_by_meaning), ("_4_1 summarize", get_summary),
+                            ("_4_2 translate", translate_all), ("_5 split subtitles", split_for_sub_main)):
+            start = time.perf_counter()
+            stage()
+            timings[name] = time.perf_counter() - start
+    server.shutdown()
+    for name, seconds in timings.items():
+        rprint(f"[cyan]{name}:[/cyan] {seconds:.2f}s")
+    rprint(f"stand-in answers: {server.counts}")
+    return timings
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM stand-in and benchmarks")
+    parser.add_argument("command", nargs="?", default="pool", choices=["serve", "pool", "hedge", "stream", "layout", "dedup", "format", "pipeline"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--replay", default=None, help="gpt_log folder to replay recorded answers from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    options = dict(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, retry_after=args.retry_after,
+                   chunk_delay=args.chunk_delay, replay_dir=args.replay, seed=args.seed)
+    if args.command == "serve":
+        server, base_url = start_stub_server(port=args.port, **options)
+        rprint(f"[green]LLM stand-in listening, set api.base_url to {base_url} ({len(server.replay)} recorded answers)[/green]")
+        threading.Event().wait()
+    elif args.command == "pipeline":
+        benchmark_pipeline(**options)
+    elif args.command == "hedge":
+        benchmark_hedging()
+    elif args.command == "stream":
+        benchmark_stream_abort()
+    elif args.command == "layout":
+        benchmark_prompt_layout()
+    elif args.command == "dedup":
+        benchmark_single_flight()
+    elif args.command == "format":
+        benchmark_translate_format()
+    else:
+        benchmark_client_pool()
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from rich import print as rprint
+from rich.table import Table
+from core.utils.models import _LLM_METRICS
+
+# ------------
+# per-call LLM telemetry: one compact json line per ask_gpt call + in-memory totals per log_title
+# ------------
+
+_lock = threading.Lock()
+_records = defaultdict(list)
+
+def new_call(log_title, model):
+    """The record filled in while a call runs, see _request / ask_gpt_async"""
+    return {"ts": time.time(), "log_title": log_title, "model": model, "cache": None, "attempts": 0, "validation_failures": 0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "queue_wait": 0.0, "latency": None, "hedged": False,
+            "routed": False, "fallback": False, "ok": False}
+
+def add_usage(call, usage):
+    if usage is None:
+        return
+    call["prompt_tokens"] += usage.prompt_tokens or 0
+    call["completion_tokens"] += usage.completion_tokens or 0
+    # prompt tokens served from the provider's prefix cache: OpenAI style, then DeepSeek style
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    call["cached_tokens"] += cached or 0
+
+def record_call(call, wall):
+    call["wall"] = wall
+    line = json.dumps({k: round(v, 3) if isinstance(v, float) else v for k, v in call.items()}, ensure_ascii=False)
+    with _lock:
+        _records[call["log_title"]].append(call)
+        os.makedirs(os.path.dirname(_LLM_METRICS), exist_ok=True)
+        with open(_LLM_METRICS, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def reset_telemetry():
+    """Forget the in-memory totals, e.g. when the next job starts in the same process. The metrics file is kept."""
+    with _lock:
+        _records.clear()
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+def summarize(records):
+    """Totals for one log_title"""
+    latencies = [r["latency"] for r in records if r.get("latency") is not None]
+    cache = [r["cache"] for r in records]
+    models = defaultdict(int)
+    for r in records:
+        models[r["model"]] += 1
+    return {
+        "calls": len(records),
+        "models": dict(models),
+        "routed": sum(1 for r in records if r.get("routed")),
+        "fallbacks": sum(1 for r in records if r.get("fallback")),
+        "local_hit": cache.count("local_hit"),
+        "shared_hit": cache.count("shared_hit"),
+        "inflight_hit": cache.count("inflight_hit"),
+        "miss": cache.count("miss"),
+        "retries": sum(max(0, r["attempts"] - 1) for r in records),
+        "validation_failures": sum(r["validation_failures"] for r in records),
+        "failed": sum(1 for r in records if not r["ok"]),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+        "cached_tokens": sum(r.get("cached_tokens", 0) for r in records),
+        "completion_tokens": sum(r["completion_tokens"] for r in records),
+        "queue_wait": sum(r["queue_wait"] for r in records),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "wall": sum(r.get("wall", 0.0) for r in records),
+    }
+
+def get_telemetry(log_titles=None):
+    with _lock:
+        titles = [t for t in (log_titles or list(_records)) if _records.get(t)]
+        return {title: summarize(_records[title]) for title in titles}
+
+def print_summary(summaries, title="📊 LLM calls"):
+    if not summaries:
+        return
+    table = Table(title=title)
+    for column in ("log_title", "calls", "model (fallbacks)", "cache L/S/dedup/miss", "retry/invalid/fail", "tokens in/out", "prefix cached", "queue wait", "latency p50/p95", "call time"):
+        table.add_column(column)
+    fmt = lambda v: "-" if v is None else f"{v:.2f}s"
+    for log_title, s in summaries.items():
+        models = ", ".join(f"{model} {n}" if len(s["models"]) > 1 else str(model) for model, n in s["models"].items())
+        table.add_row(log_title, str(s["calls"]), models + (f" ({s['fallbacks']})" if s["fallbacks"] else ""), f"{s['local_hit']}/{s['shared_hit']}/{s['inflight_hit']}/{s['miss']}",
+                      f"{s['retries']}/{s['validation_failures']}/{s['failed']}", f"{s['prompt_tokens']}/{s['completion_tokens']}",
+                      f"{s['cached_tokens'] / s['prompt_tokens']:.0%}" if s['prompt_tokens'] else "-",
+                      f"{s['queue_wait']:.1f}s", f"{fmt(s['latency_p50'])}/{fmt(s['latency_p95'])}", f"{s['wall']:.1f}s")
+    rprint(table)
+
+def report_telemetry(log_titles):
+    print_summary(get_telemetry(log_titles))
+
+def summarize_metrics_file(path=_LLM_METRICS):
+    """Per log_title summary of a metrics file, e.g. to compare runs or find the stage that dominates wall time"""
+    records = defaultdict(list)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            records[record["log_title"]].append(record)
+    return {title: summarize(rs) for title, rs in records.items()}
+
+if __name__ == "__main__":
+    import sys
+    print_summary(summarize_metrics_file(sys.argv[1] if len(sys.argv) > 1 else _LLM_METRICS))
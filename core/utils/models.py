@@ -12,6 +12,11 @@ _5_REMERGED = "output/log/translation_results_remerged.xlsx"
 
 _8_1_AUDIO_TASK = "output/audio/tts_tasks.xlsx"
 
+# per-job config values (detected language, batch task languages ...)
+_JOB_CONFIG = "output/log/job_config.json"
+# one json line per LLM call (tokens, latency, retries, cache hits)
+_LLM_METRICS = "output/log/llm_metrics.jsonl"
+
 
 # ------------------------------------------
 # 定义音频文件
@@ -38,6 +43,8 @@ __all__ = [
     "_5_SPLIT_SUB",
     "_5_REMERGED",
     "_8_1_AUDIO_TASK",
+    "_JOB_CONFIG",
+    "_LLM_METRICS",
     "_OUTPUT_DIR",
     "_AUDIO_DIR",
     "_RAW_AUDIO_FILE",
@@ -1,4 +1,5 @@
 import os
+import gc
 import glob
 from core._1_ytdlp import find_video_files
 import shutil
@@ -18,6 +19,20 @@ def cleanup(history_dir="history"):
     os.makedirs(log_dir, exist_ok=True)
     os.makedirs(gpt_log_dir, exist_ok=True)
 
+    # Close the GPT cache db so cache.db and its -wal / -shm files can be moved
+    from core.utils.gpt_cache import close_connections
+    close_connections()
+
+    # Decoded PCM caches are large and can be regenerated from the audio, unmap them first (Windows refuses to delete mapped files)
+    from core.asr_backend.pcm_cache import release_pcm
+    release_pcm()
+    gc.collect()
+    for file in glob.glob("output/audio/*.16k.s16le"):
+        try:
+            os.remove(file)
+        except OSError as e:
+            print(f"⚠️ Skipped deleting {file}: {e}")
+
     # Move non-log files
     for file in glob.glob("output/*"):
         if not file.endswith(('log', 'gpt_log')):
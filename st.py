@@ -3,6 +3,7 @@ import os, sys
 from core.st_utils.imports_and_utils import *
 from core import *
 from core.subtitle_burner import burn_subtitle_to_video
+from core.utils.ask_gpt import reset_llm_stats
 
 # SET PATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -47,6 +48,23 @@ def text_processing_section():
         return True
 
 def process_text():
+    reset_llm_stats()
+    if load_key("streaming_pipeline") and not load_key("pause_before_translate"):
+        with st.spinner(t("Summarizing and translating...")):
+            stream_pipeline.transcribe_and_translate()
+    else:
+        process_text_steps()
+    with st.spinner(t("Processing and aligning subtitles...")): 
+        _5_split_sub.split_for_sub_main()
+        _6_gen_sub.align_timestamp_main()
+    with st.spinner(t("Merging subtitles to video...")):
+        # 直接调用，让ffmpeg在终端显示输出
+        _7_sub_into_vid.merge_subtitles_to_video()
+    
+    st.success(t("Subtitle processing complete! 🎉"))
+    st.balloons()
+
+def process_text_steps():
     with st.spinner(t("Using Whisper for transcription...")):
         _2_asr.transcribe()
     with st.spinner(t("Splitting long sentences...")):  
@@ -57,15 +75,6 @@ def process_text():
         if load_key("pause_before_translate"):
             input(t("⚠️ PAUSE_BEFORE_TRANSLATE. Go to `output/log/terminology.json` to edit terminology. Then press ENTER to continue..."))
         _4_2_translate.translate_all()
-    with st.spinner(t("Processing and aligning subtitles...")): 
-        _5_split_sub.split_for_sub_main()
-        _6_gen_sub.align_timestamp_main()
-    with st.spinner(t("Merging subtitles to video...")):
-        # 直接调用，让ffmpeg在终端显示输出
-        _7_sub_into_vid.merge_subtitles_to_video()
-    
-    st.success(t("Subtitle processing complete! 🎉"))
-    st.balloons()
 
 def audio_processing_section():
     st.markdown("""